@@ -0,0 +1,40 @@
+"""
+Compare two result files of run.py and report the regressions.
+
+    python benchmarks/compare.py before.json after.json --threshold 0.1
+
+Exit with status 1 if a benchmark is slower (or uses more memory) than
+before by more than the threshold.
+"""
+import sys
+import json
+import argparse
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('--threshold', type=float, default=0.1, help='tolerated relative slow-down')
+    n = parser.parse_args()
+
+    with open(n.before) as f:
+        before = json.load(f)["results"]
+    with open(n.after) as f:
+        after = json.load(f)["results"]
+
+    regressions = 0
+    for name in sorted(before.keys() & after.keys()):
+        # the time benchmarks have a "seconds" value, the memory ones "bytes"
+        key = "seconds" if "seconds" in before[name] else "bytes"
+        ratio = after[name][key] / before[name][key]
+        flag = ''
+        if ratio > 1 + n.threshold:
+            flag = '  REGRESSION'
+            regressions += 1
+        print(f"{name:20} {key:8} {before[name][key]:12.6g} -> {after[name][key]:12.6g}  x{ratio:.2f}{flag}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
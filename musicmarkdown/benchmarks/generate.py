@@ -0,0 +1,91 @@
+"""
+Generator of synthetic music grid markdown scripts, for the benchmarks.
+
+    python benchmarks/generate.py --rows 5000 > big.txt
+"""
+import random
+import argparse
+
+CHORDS = ['C', 'Dm', 'Em', 'F', 'G7', 'Am', 'Bb', 'A7', 'D7', 'Gm', 'Ebmaj7', 'F#m7b5', 'C/E', 'Bbm6', 'Db7#9']
+
+
+def bar(rnd):
+    """The content of a measure."""
+    kind = rnd.random()
+    if kind < 0.08:
+        content = f'-{rnd.randint(2, 16)}-'
+    elif kind < 0.14:
+        content = '==='
+    elif kind < 0.26:
+        content = '%'
+    else:
+        content = ' '.join(rnd.choice(CHORDS) if rnd.random() < 0.85 else '-' for _ in range(rnd.randint(1, 4)))
+    if rnd.random() < 0.05:
+        content += rnd.choice([' .l', ' .s'])
+    return content
+
+
+def row(rnd):
+    """A grid row of 2 to 6 measures, with repeats, cases and time signatures."""
+    bars = [bar(rnd) for _ in range(rnd.choice([2, 4, 4, 4, 6]))]
+    line = ''
+    if rnd.random() < 0.05:
+        line += rnd.choice(['4/4', '3/4', '6/8']) + ' '
+    if rnd.random() < 0.15:
+        bars[-2] = '{1.} ' + bars[-2]
+        bars[-1] = '{2.} ' + bars[-1]
+        line += '[: ' + ' | '.join(bars[:-1]) + ' :] ' + bars[-1] + ' |'
+    elif rnd.random() < 0.1:
+        line += '[: ' + ' | '.join(bars) + ' :]'
+    else:
+        if rnd.random() < 0.05:
+            bars[0] = '{' + rnd.choice(['solo trumpet', 'tacet first', 'Break!']) + '} ' + bars[0]
+        line += '| ' + ' | '.join(bars) + ' |'
+    if rnd.random() < 0.03:
+        line += ' // ' + rnd.choice(['check the voicing', 'ritardando', 'tutti'])
+    return line
+
+
+def section(rnd, name):
+    line = f'- [{name}]x{rnd.randint(1, 4)}'
+    if rnd.random() < 0.5:
+        line += ' ' + rnd.choice(['Play softly', 'Double tempo', 'Drums only', '"Swing"'])
+    if rnd.random() < 0.2:
+        line += f' -> [{rnd.choice("ABCD")}]'
+    return line
+
+
+def generate_script(rows=1000, seed=0):
+    """
+    Return a script of about `rows` grid rows, split in sections of 4 to 16
+    rows, with a header and some vertical spaces and comments.
+    """
+    rnd = random.Random(seed)
+    lines = [
+        f'# Synthetic tune {seed}',
+        '## generated for the benchmarks',
+        'Author: musicmd benchmarks // generate.py',
+        'Copyright: Public domain',
+        '',
+        '// the sections follow',
+    ]
+    n = 0
+    sec = 0
+    while n < rows:
+        lines.append('')
+        lines.append(section(rnd, 'ABCDEFGH'[sec % 8] + (str(sec // 8) if sec >= 8 else '')))
+        sec += 1
+        for _ in range(min(rnd.randint(4, 16), rows - n)):
+            lines.append(row(rnd))
+            n += 1
+        if rnd.random() < 0.3:
+            lines.append(rnd.choice(['%vspace%', '%vspace-big%', '%vspace-small%']))
+    return '\n'.join(lines) + '\n'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Print a synthetic music grid markdown script')
+    parser.add_argument('--rows', type=int, default=1000, help='number of grid rows')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the random generator')
+    n = parser.parse_args()
+    print(generate_script(n.rows, n.seed), end='')
@@ -0,0 +1,127 @@
+"""
+Load test of the live preview server.
+
+Start `python -m musicmd <script> serve --no-write` in a subprocess, then
+run simulated preview clients against it: each client requests the page
+a number of times, while other clients keep an event stream open or hold
+a connection without sending anything. Report the latency percentiles of
+the page requests.
+
+    python benchmarks/load_server.py --clients 20 --requests 50 --streams 20 --stuck 5
+"""
+import os
+import re
+import sys
+import time
+import shutil
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SCRIPT = os.path.join(HERE, '..', '..', 'script.txt')
+
+
+def start_server(script, workdir):
+    shutil.copy(script, os.path.join(workdir, 'script.txt'))
+    env = dict(os.environ, PYTHONPATH=os.path.join(HERE, '..'))
+    proc = subprocess.Popen([sys.executable, '-u', '-m', 'musicmd', 'script.txt', 'serve', '--no-write'],
+                            cwd=workdir, env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                            stderr=subprocess.DEVNULL, text=True)
+    for line in proc.stdout:
+        m = re.search(r'http://localhost:(\d+)', line)
+        if m:
+            return proc, int(m.group(1))
+    raise RuntimeError("the server did not start")
+
+
+def wait_compiled(port):
+    while True:
+        conn = http.client.HTTPConnection('localhost', port)
+        conn.request('GET', '/')
+        status = conn.getresponse().status
+        conn.close()
+        if status == 200:
+            return
+        time.sleep(0.05)
+
+
+def page_client(port, requests, latencies):
+    for _ in range(requests):
+        start = time.perf_counter()
+        conn = http.client.HTTPConnection('localhost', port, timeout=60)
+        conn.request('GET', '/', headers={'Accept-Encoding': 'gzip'})
+        resp = conn.getresponse()
+        resp.read()
+        conn.close()
+        latencies.append(time.perf_counter() - start)
+        assert resp.status == 200, resp.status
+
+
+def stream_client(port, stop):
+    conn = http.client.HTTPConnection('localhost', port)
+    conn.request('GET', '/events/')
+    conn.getresponse()
+    stop.wait()
+    conn.close()
+
+
+def stuck_client(port, stop):
+    # connect and never send the request
+    sock = socket.create_connection(('localhost', port))
+    stop.wait()
+    sock.close()
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--script', default=DEFAULT_SCRIPT, help='the music grid script to serve')
+    parser.add_argument('--clients', type=int, default=20, help='number of concurrent page clients')
+    parser.add_argument('--requests', type=int, default=50, help='page requests per client')
+    parser.add_argument('--streams', type=int, default=10, help='idle clients with an open event stream')
+    parser.add_argument('--stuck', type=int, default=5, help='clients that connect and send nothing')
+    n = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    proc, port = start_server(n.script, workdir)
+    stop = threading.Event()
+    try:
+        wait_compiled(port)
+        idle = [threading.Thread(target=stream_client, args=(port, stop)) for _ in range(n.streams)]
+        idle += [threading.Thread(target=stuck_client, args=(port, stop)) for _ in range(n.stuck)]
+        for t in idle:
+            t.start()
+
+        latencies = []
+        clients = [threading.Thread(target=page_client, args=(port, n.requests, latencies))
+                   for _ in range(n.clients)]
+        start = time.perf_counter()
+        for t in clients:
+            t.start()
+        for t in clients:
+            t.join()
+        elapsed = time.perf_counter() - start
+
+        print(f"{len(latencies)} requests from {n.clients} clients "
+              f"({n.streams} open event streams, {n.stuck} stuck connections) in {elapsed:.2f} s, "
+              f"{len(latencies) / elapsed:.0f} requests/s")
+        print(f"latency p50 {percentile(latencies, 50) * 1000:.1f} ms, "
+              f"p99 {percentile(latencies, 99) * 1000:.1f} ms, "
+              f"max {max(latencies) * 1000:.1f} ms")
+    finally:
+        stop.set()
+        proc.kill()
+        proc.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
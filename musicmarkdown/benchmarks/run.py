@@ -0,0 +1,169 @@
+"""
+Benchmark suite of the parser, the renderer, the compiler and the live server.
+
+The scripts are generated by generate.py. The results are written as JSON,
+to be compared across commits with compare.py.
+
+    python benchmarks/run.py --rows 1000 10000 --output results.json
+
+Exit with status 1 if the start-up time (compiling the smallest script in a
+new process) is over the budget given with --startup-budget.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import subprocess
+import statistics
+import http.client
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))  # benchmark the working tree
+
+import musicmd
+from generate import generate_script
+from load_server import start_server, wait_compiled, percentile
+
+# seconds to start the command line and compile a small script (median); the
+# start-up was 0.07 s after the lazy imports, and 0.22 s before
+STARTUP_BUDGET = 0.15
+
+
+def measure(fn, repeat):
+    """Run fn repeat times, return the median and min durations in seconds."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return {"seconds": statistics.median(times), "min_seconds": min(times)}
+
+
+def bench_parse(lines, repeat):
+    result = measure(lambda: musicmd.GridProcessor().run(lines), repeat)
+    result["lines_per_second"] = len(lines) / result["seconds"]
+    return result
+
+
+def bench_render(lines, repeat):
+    g = musicmd.GridProcessor().run(lines)
+    size = len(g.to_html().encode('utf-8'))
+    result = measure(g.to_html, repeat)
+    result["html_bytes"] = size
+    result["bytes_per_second"] = size / result["seconds"]
+    return result
+
+
+def bench_compile(script, workdir, repeat):
+    out = os.path.join(workdir, 'out.html')
+    return measure(lambda: musicmd.compile_mmd(script, out_filename=out), repeat)
+
+
+def bench_memory(lines):
+    gp = musicmd.GridProcessor()
+    # the interned measures and leaves of the previous benchmarks would not
+    # be counted: start from empty caches, as in a new process
+    musicmd.GridProcessor.parse_measure.cache_clear()
+    musicmd.shared_node.cache_clear()
+    tracemalloc.start()
+    g = gp.run(lines)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    bars = sum(len(node.children) for node in g.tree if isinstance(node, musicmd.GridRow))
+    return {"bytes": size, "bars": bars, "bytes_per_bar": size / bars}
+
+
+def bench_startup(script, workdir, repeat):
+    env = dict(os.environ, PYTHONPATH=os.path.join(HERE, '..'))
+    cmd = [sys.executable, '-m', 'musicmd', script, '-o', os.path.join(workdir, 'startup.html')]
+    return measure(lambda: subprocess.run(cmd, env=env, check=True), repeat)
+
+
+def bench_server(script, workdir, requests):
+    proc, port = start_server(script, workdir)
+    try:
+        wait_compiled(port)
+        latencies = []
+        for _ in range(requests):
+            start = time.perf_counter()
+            conn = http.client.HTTPConnection('localhost', port)
+            conn.request('GET', '/', headers={'Accept-Encoding': 'gzip'})
+            conn.getresponse().read()
+            conn.close()
+            latencies.append(time.perf_counter() - start)
+    finally:
+        proc.kill()
+        proc.wait()
+    return {"seconds": statistics.median(latencies),
+            "p50_seconds": percentile(latencies, 50),
+            "p99_seconds": percentile(latencies, 99)}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=HERE, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000],
+                        help='sizes of the generated scripts, in grid rows')
+    parser.add_argument('--repeat', type=int, default=5, help='repetitions of each measure')
+    parser.add_argument('--requests', type=int, default=200, help='requests of the server benchmark')
+    parser.add_argument('--output', help='JSON file of the results (default: standard output)')
+    parser.add_argument('--startup-budget', type=float, default=STARTUP_BUDGET, metavar='SECONDS',
+                        help=f'maximum start-up time (default: {STARTUP_BUDGET}, 0 for no budget)')
+    n = parser.parse_args()
+
+    results = {}
+    workdir = tempfile.mkdtemp()
+    try:
+        for rows in n.rows:
+            text = generate_script(rows)
+            script = os.path.join(workdir, f'script_{rows}.txt')
+            with open(script, 'w', encoding='utf-8') as f:
+                f.write(text)
+            lines = text.splitlines(True)
+            print(f"benchmarking {rows} rows...", file=sys.stderr)
+            results[f"parse/{rows}"] = bench_parse(lines, n.repeat)
+            results[f"render/{rows}"] = bench_render(lines, n.repeat)
+            results[f"compile/{rows}"] = bench_compile(script, workdir, n.repeat)
+            results[f"memory/{rows}"] = bench_memory(lines)
+            results[f"server/{rows}"] = bench_server(script, workdir, n.requests)
+        script = os.path.join(workdir, f'script_{n.rows[0]}.txt')
+        results["startup"] = bench_startup(script, workdir, n.repeat)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "date": time.strftime('%Y-%m-%dT%H:%M:%S'),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+    if n.output:
+        with open(n.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    startup = results["startup"]["seconds"]
+    if n.startup_budget and startup > n.startup_budget:
+        print(f"start-up time {startup:.3f} s over the budget of {n.startup_budget:.3f} s", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Stress test of the reentrant compile API.
+
+Compile many distinct synthetic scripts concurrently with compile_string()
+in a thread pool, and check that each output is the one of a sequential
+compilation, and that the header of each page (title, author, copyright)
+is the one of its own script.
+
+    python benchmarks/stress_compile.py --scripts 200 --threads 16
+"""
+import os
+import sys
+import argparse
+from time import perf_counter
+from concurrent.futures import ThreadPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+
+import musicmd  # noqa: E402
+from generate import generate_script  # noqa: E402
+
+
+def make_script(seed, rows):
+    # give each script a distinct header, with and without the optional fields
+    script = generate_script(rows, seed).replace('musicmd benchmarks', f'author {seed}')
+    script = script.replace('Public domain', f'copyright {seed}')
+    if seed % 3 == 0:
+        script = script.replace(f'Copyright: copyright {seed}\n', '')
+    return script
+
+
+def check_header(seed, html):
+    errors = []
+    if f'<h1>Synthetic tune {seed}</h1>' not in html:
+        errors.append('title')
+    if f'<p class="author">author {seed}</p>' not in html:
+        errors.append('author')
+    has_copyright = f'®copyright {seed}</div>' in html
+    if has_copyright != (seed % 3 != 0) or html.count('class="footer"') > 1:
+        errors.append('copyright')
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compile many scripts concurrently and check the outputs')
+    parser.add_argument('--scripts', type=int, default=200, help='number of distinct scripts')
+    parser.add_argument('--rows', type=int, default=50, help='number of grid rows of each script')
+    parser.add_argument('--threads', type=int, default=16, help='number of threads')
+    parser.add_argument('--rounds', type=int, default=3, help='number of concurrent compilations of each script')
+    n = parser.parse_args()
+
+    scripts = [make_script(seed, n.rows) for seed in range(n.scripts)]
+    expected = [musicmd.compile_string(script) for script in scripts]
+
+    jobs = [seed for _ in range(n.rounds) for seed in range(n.scripts)]
+    start = perf_counter()
+    with ThreadPoolExecutor(max_workers=n.threads) as pool:
+        outputs = list(pool.map(lambda seed: musicmd.compile_string(scripts[seed]), jobs))
+    seconds = perf_counter() - start
+
+    failed = 0
+    for seed, html in zip(jobs, outputs):
+        errors = check_header(seed, html)
+        if html != expected[seed]:
+            errors.append('output')
+        if errors:
+            failed += 1
+            print(f'script {seed}: wrong {", ".join(errors)}')
+    print(f'{len(jobs)} compilations in {n.threads} threads in {seconds:.2f} s, {failed} failed')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,15 +1,50 @@
-import json
+import io
 import re
-from http.server import HTTPServer, SimpleHTTPRequestHandler
 import threading
-from time import sleep
 import os
-from pkg_resources import resource_string
+from time import perf_counter, time
+from functools import lru_cache
+from contextlib import contextmanager, nullcontext
+from collections import deque
 import logging
 
 logger = logging.getLogger(__name__)
 log = logger.warning
 
+
+@lru_cache(maxsize=None)
+def load_resource(name):
+    """
+    Return the content of a file in the resources folder of the package.
+    The file is read only once per process.
+    """
+    path = os.path.join(os.path.dirname(__file__), 'resources', name)
+    with open(path, "r", encoding='utf-8') as f:
+        return f.read()
+
+
+def page_head(css, extra_style=''):
+    """
+    The start of an HTML document, up to the opening body tag, with the
+    style sheet css followed by extra_style.
+    """
+    return '<!DOCTYPE html>\n' \
+           '<html lang="en" dir="ltr">\n' \
+           '<head>\n' \
+           '<meta charset="utf-8">' \
+           f'<style>{css}{extra_style}</style>' \
+           '</head>' \
+           '<body>'
+
+
+def __getattr__(name):
+    # the live server needs http.server, which is imported only when used
+    if name in ("CustomHandler", "ThreadedServer"):
+        from . import server
+        return getattr(server, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 class Grid:
     """
     The markdown document object.
@@ -21,6 +56,8 @@ class Grid:
         self.tree = []
         self.gridRows = []
         self.debug = []
+        # the header fields of this grid (Grid.info lists the field names)
+        self.info = dict.fromkeys(Grid.info)
 
     @staticmethod
     def parse_section(text):
@@ -40,50 +77,96 @@ class Grid:
         "copyright": None
     }
 
-    def to_html(self, live_server_addr=None):
+    def iter_html(self, live_server_addr=None, tree_html=None, version=None):
+        """
+        Compile the tree in HTML format, yielding the output in fragments.
+
+        tree_html is an optional iterable with the already rendered HTML of
+        the nodes of self.tree. version is the version of the page on the
+        live server (see Watcher.version), from which the page asks for the
+        events of the next recompilations.
+        """
         if live_server_addr is not None:
             # meta_refresh = '<meta http-equiv="refresh" content="1">'
-            script_refresh = resource_string('musicmd', 'resources/musicgrid.js').decode()
+            script_refresh = load_resource('musicgrid.js')
             jscript = '<script type = "text/javascript" >\n' \
                            f'var server_address = "{live_server_addr}"\n' \
+                           f'var page_version = {"null" if version is None else int(version)}\n' \
                            f'{script_refresh}\n</script>\n'
         else:
             jscript = ''
 
 
-        css = resource_string('musicmd', 'resources/musicgrid.css').decode()
+        # Grid.html is shared by all the grids: the page skeleton is kept
+        # local, so that grids can be rendered concurrently
+        head = page_head(load_resource('musicgrid.css')) + '<div class="page">'
 
-        self.html["head"] = '<!DOCTYPE html>\n'\
-                            '<html lang="en" dir="ltr">\n'\
-                            '<head>\n' \
-                            '<meta charset="utf-8">' \
-                            '<style>' \
-                            f'{css}' \
-                            '</style>' \
-                            '</head>' \
-                            '<body>' \
-                            '<div class="page">'
+        tail = f'</div>\n{jscript}\n</body>\n</html>'
 
-        self.html["tail"] = f'</div>\n{jscript}\n</body>\n</html>'
+        yield head
+        yield from self.iter_body(tree_html)
+        yield '\n'
+        yield tail
 
+    def iter_body(self, tree_html=None):
+        """
+        Compile the content of the page (header, elements and copyright)
+        in HTML format, yielding the output in fragments.
+        """
         tag = self.html
-        out_html = [tag["head"], '<div class="header">']
+        yield '\n<div class="header">'
         # header
         for key, val in self.info.items():
             if (key != "copyright") and val:
-                out_html.append(tag[key].format(t=val))
-        out_html.append('</div>')
+                yield '\n'
+                yield tag[key].format(t=val)
+        yield '\n</div>'
 
         # Elements
-        for item in self.tree:
-            out_html.append(item.to_html())
+        if tree_html is None:
+            for item in self.tree:
+                yield '\n'
+                yield item.to_html()
+        else:
+            for html in tree_html:
+                yield '\n'
+                yield html
 
         # copyright
         if self.info["copyright"]:
-            out_html.append(tag["copyright"].format(t=self.info["copyright"]))
-        out_html.append(tag["tail"])
-
-        return '\n'.join(out_html)
+            yield '\n'
+            yield tag["copyright"].format(t=self.info["copyright"])
+
+    def page_ranges(self, rows_per_page):
+        """
+        Split the tree in pages of at least rows_per_page grid rows, cut
+        before a section or a vertical space. Return the list of the
+        (start, end) slices of self.tree of the pages.
+        """
+        ranges = []
+        start = 0
+        rows = 0
+        for i, node in enumerate(self.tree):
+            if rows >= rows_per_page and isinstance(node, (Section, Vspace)):
+                ranges.append((start, i))
+                start = i
+                rows = 0
+            if isinstance(node, GridRow):
+                rows += 1
+        ranges.append((start, len(self.tree)))
+        return ranges
+
+    def write_html(self, f, live_server_addr=None, tree_html=None, version=None):
+        """
+        Compile the tree in HTML format and write it to the file object f.
+        """
+        f.writelines(self.iter_html(live_server_addr=live_server_addr, tree_html=tree_html, version=version))
+
+    def to_html(self, live_server_addr=None, tree_html=None, version=None):
+        """
+        Compile the tree in HTML format and return it as a string.
+        """
+        return ''.join(self.iter_html(live_server_addr=live_server_addr, tree_html=tree_html, version=version))
 
     def __repr__(self):
         d = str(self.info)
@@ -100,20 +183,16 @@ class Element:
     """
     An leaf of the abstract syntax tree.
     """
+    __slots__ = ('html_text',)
     tag_start = ""
     rep_tag = 'Element'
-    html_text = ''
+
+    def __init__(self, text=''):
+        self.html_text = text
 
     def to_html(self):
-        if self.tag_start:
-            tag_end = '</' + self.tag_start.split(' ')[0][1:] + '>'
-        else:
-            tag_end = ''
-        return ''.join([self.tag_start, self.html_text, tag_end])
-        # try:
-        #     return ''.join([self.tag_start, self.html_text, tag_end])
-        # except Exception():
-        #     log("ERROR", self.tag_start, self.html_text)
+        tag_start = self.tag_start
+        return ''.join([tag_start, self.html_text, tag_end(tag_start)])
 
     def __repr__(self):
         return f"{self.rep_tag}({self.html_text})"
@@ -123,28 +202,17 @@ class ElementGroup:
     """
     An node of the abstract syntax tree that can have children elements.
     """
+    __slots__ = ('children',)
     tag_start = ''
     rep_tag = "ElementGroup"
 
     def __init__(self):
         self.children = []
-        self.html_text = ''
 
     def to_html(self):
-        tag_end = '</' + self.tag_start.split(' ')[0][1:] + '>'
-        out = []
-        for child in self.children:
-            if child is not None:
-                out.append('\t' + child.to_html())
-
-        self.html_text = '\n'.join(out)
-        # try:
-        #     #             assert(all([x is not None for x in out]))
-        #     self.html_text = '\n'.join(out)
-        # except:
-        #     log("ERROR", type(self), out)
-        #     raise
-        return '\n'.join([self.tag_start, self.html_text, tag_end])
+        parts = []
+        emit(self, parts)
+        return ''.join(parts)
 
     def get_child(self, num):
         return self.children[num]
@@ -157,16 +225,19 @@ class ElementGroup:
 
 
 class BarBlock(ElementGroup):
+    __slots__ = ('size', 'case', 'bar', 'html')
     rep_tag = "BarBlock"
 
     def __init__(self, size=''):
         self.size = size
         self.case = None
         self.bar = Bar()
+        # the rendered HTML of the shared bar blocks (see GridProcessor.parse_measure)
+        self.html = None
 
     @property
     def tag_start(self):
-        return f'<div class="bar-block {self.size}">'
+        return bar_block_start(self.size)
 
     @property
     def children(self):
@@ -174,6 +245,7 @@ class BarBlock(ElementGroup):
 
 
 class Bar(ElementGroup):
+    __slots__ = ('chordBlock',)
     tag_start = '<div class="bar">'
     rep_tag = "Bar"
 
@@ -192,11 +264,13 @@ class Bar(ElementGroup):
 
 
 class ChordBlock(ElementGroup):
+    __slots__ = ()
     tag_start = '<div class="chords">'
     rep_tag = "ChordBlock"
 
 
 class Chord(Element):
+    __slots__ = ()
     tag_start = '<div class="chord">'
     rep_tag = "Chord"
 
@@ -206,6 +280,7 @@ class Chord(Element):
 
 
 class EmptyChord(Chord):
+    __slots__ = ()
     tag_start = '<div class="chord">'
     rep_tag = "Chord"
 
@@ -214,6 +289,7 @@ class EmptyChord(Chord):
 
 
 class Case(Element):
+    __slots__ = ('tag_start',)
     rep_tag = "Case"
 
     def __init__(self, text):
@@ -226,22 +302,28 @@ class Case(Element):
 
 
 class Barline(Element):
+    __slots__ = ('kind', 'tag_start')
     rep_tag = "Barline"
 
     def __init__(self, kind=''):
+        super().__init__()
+        self.kind = kind
         self.tag_start = f'<div class="barline {kind}">'
 
 
 class Pause(Element):
+    __slots__ = ('number',)
     rep_tag = "Pause"
     tag_start = '<div class="pause">'
 
     def __init__(self, n):
+        self.number = n
         self.html_text = f'<div class="pause-line"></div><div class="pause-number"> {n} </div><div ' \
                          f'class="pause-line"></div> '
 
 
 class Pentagram(Element):
+    __slots__ = ()
     rep_tag = "Pentagram"
     tag_start = '<div class="pentagram">'
 
@@ -250,14 +332,18 @@ class Pentagram(Element):
 
 
 class Time(Element):
+    __slots__ = ('divisions', 'value')
     rep_tag = "Time"
     tag_start = '<div class="time">'
 
     def __init__(self, divisions, value):
+        self.divisions = divisions
+        self.value = value
         self.html_text = f'<span>{divisions}</span><span>{value}</span>'
 
 
 class Repeat(Element):
+    __slots__ = ()
     rep_tag = "Repeat"
     tag_start = '<div class="repeat">'
 
@@ -266,6 +352,7 @@ class Repeat(Element):
 
 
 class SameMeasure(Chord):
+    __slots__ = ()
     rep_tag = "%"
     tag_start = '<div class="chord same-bar">'
 
@@ -274,6 +361,7 @@ class SameMeasure(Chord):
 
 class GridRow(ElementGroup):
     # A row consists of may bars
+    __slots__ = ()
     tag_start = '<div class="grid-row">'
     rep_tag = "Row"
 
@@ -281,7 +369,9 @@ class GridRow(ElementGroup):
         super(GridRow, self).__init__()
 
 class Vspace(Element):
+    __slots__ = ('kind', 'tag_start')
     def __init__(self, kind=''):
+        self.kind = kind
         if kind:
             self.tag_start = f'<div class="vspace-{kind}">'
         else:
@@ -290,6 +380,7 @@ class Vspace(Element):
 
 
 class SectionName(Element):
+    __slots__ = ()
     tag_start = '<p class="name">'
     rep_tag = "Name"
 
@@ -298,14 +389,17 @@ class SectionName(Element):
 
 
 class SectionRepetitions(Element):
+    __slots__ = ('num',)
     tag_start = '<p class="repeats">'
     rep_tag = "Rep"
 
     def __init__(self, num):
+        self.num = num
         self.html_text = "x" + str(num)
 
 
 class Rarrow(Element):
+    __slots__ = ()
     tag_start = '<p class="debug arrow">'
     rep_tag = "->"
 
@@ -314,6 +408,7 @@ class Rarrow(Element):
 
 
 class SectionComment(Element):
+    __slots__ = ()
     tag_start = '<span class="note">'
     rep_tag = "Comment"
 
@@ -322,22 +417,153 @@ class SectionComment(Element):
 
 
 class NotRecognized(Element):
+    __slots__ = ('text',)
     tag_start = '<span class="error">'
     rep_tag = "Error"
 
     def __init__(self, text):
+        self.text = text
         self.html_text = f'SyntaxError: "{text}"'
 
 
 class Section(ElementGroup):
+    __slots__ = ()
     rep_tag = "Section"
     tag_start = '<section class="tune-section">'
 
 
 class BarlineSimple(Element):
+    __slots__ = ()
     tag_start = '<section class="tune-section">'
 
 
+@lru_cache(maxsize=1024)
+def shared_node(cls, *args):
+    """
+    Return an instance of the node class cls, shared by all the calls with
+    the same arguments. The shared nodes must not be modified.
+    """
+    return cls(*args)
+
+
+# Rendering
+#
+# The nodes are rendered by a table-driven emitter: EMITTERS maps each node
+# class to a function emit(node, parts) that appends the HTML fragments of
+# the node to the list parts. The closing tags are computed once for each
+# opening tag, and the grid rows, which are most of a page, are rendered by
+# a single function without recursion.
+
+TAG_ENDS = {'': ''}
+
+
+def tag_end(tag_start):
+    """The closing tag of the opening tag tag_start ('' for no tag)."""
+    end = TAG_ENDS.get(tag_start)
+    if end is None:
+        end = TAG_ENDS[tag_start] = '</' + tag_start.split(' ')[0][1:] + '>'
+    return end
+
+
+BAR_BLOCK_STARTS = {}
+
+
+def bar_block_start(size):
+    start = BAR_BLOCK_STARTS.get(size)
+    if start is None:
+        start = BAR_BLOCK_STARTS[size] = f'<div class="bar-block {size}">'
+    return start
+
+
+def emit(node, parts):
+    """Append the HTML fragments of node to the list parts."""
+    EMITTERS.get(type(node), emit_fallback)(node, parts)
+
+
+def emit_fallback(node, parts):
+    # node classes without their own emitter (e.g. subclasses defined elsewhere)
+    if isinstance(node, ElementGroup):
+        emit_group(node, parts)
+    else:
+        emit_element(node, parts)
+
+
+def emit_element(node, parts):
+    tag_start = node.tag_start
+    parts += (tag_start, node.html_text, tag_end(tag_start))
+
+
+def emit_group(node, parts):
+    tag_start = node.tag_start
+    parts += (tag_start, '\n')
+    sep = '\t'
+    for child in node.children:
+        if child is not None:
+            parts.append(sep)
+            emit(child, parts)
+            sep = '\n\t'
+    parts += ('\n', tag_end(tag_start))
+
+
+def emit_row(row, parts):
+    # GridRow > BarBlock > (Case, Bar) > (leaves, ChordBlock > chords),
+    # with the fixed tags of the classes
+    parts += (ROW_START, '\n')
+    sep = '\t'
+    for bb in row.children:
+        parts.append(sep)
+        sep = '\n\t'
+        html = bb.html
+        if html is not None:
+            parts.append(html)
+        else:
+            emit_bar_block(bb, parts)
+    parts += ('\n', ROW_END)
+
+
+def emit_bar_block(bb, parts):
+    html = bb.html
+    if html is not None:
+        parts.append(html)
+        return
+    parts += (bar_block_start(bb.size), '\n')
+    case = bb.case
+    if case is not None:
+        case_start = case.tag_start
+        parts += ('\t', case_start, case.html_text, tag_end(case_start), '\n\t', BAR_START, '\n')
+    else:
+        parts += ('\t', BAR_START, '\n')
+    item_sep = '\t'
+    for item in bb.bar.children:
+        parts.append(item_sep)
+        item_sep = '\n\t'
+        if type(item) is ChordBlock:
+            parts += (CHORDS_START, '\n')
+            chord_sep = '\t'
+            for chord in item.children:
+                chord_start = chord.tag_start
+                parts += (chord_sep, chord_start, chord.html_text, tag_end(chord_start))
+                chord_sep = '\n\t'
+            parts += ('\n', CHORDS_END)
+        else:
+            item_start = item.tag_start
+            parts += (item_start, item.html_text, tag_end(item_start))
+    parts += ('\n', BAR_END, '\n', BAR_BLOCK_END)
+
+
+ROW_START, ROW_END = GridRow.tag_start, tag_end(GridRow.tag_start)
+BAR_START, BAR_END = Bar.tag_start, tag_end(Bar.tag_start)
+BAR_BLOCK_END = tag_end(bar_block_start(''))
+CHORDS_START, CHORDS_END = ChordBlock.tag_start, tag_end(ChordBlock.tag_start)
+
+EMITTERS = {cls: emit_element for cls in (Element, Chord, EmptyChord, SameMeasure, Case, Barline, Pause, Pentagram,
+                                          Time, Repeat, Vspace, SectionName, SectionRepetitions, Rarrow,
+                                          SectionComment, NotRecognized, BarlineSimple)}
+EMITTERS.update({cls: emit_group for cls in (ElementGroup, Bar, ChordBlock, Section)})
+EMITTERS[BarBlock] = emit_bar_block
+EMITTERS[GridRow] = emit_row
+
+
 class GridProcessor:
     """
     The Music Grid Markdown parser.
@@ -351,83 +577,96 @@ class GridProcessor:
         "copyright": re.compile(r"^(?i:copyright:)(.+)$"),
         "vspace": re.compile(r"^%vspace-?(.*)%$"),
         "tag": re.compile(r"^(<.*>)$"),
-        "comment": re.compile(r"^(.*)(?=(//))(.*)$"),
         "sections-line": re.compile(r"^\s*-(.*)$"),
         "grid-row": re.compile(r"^(?:(?P<num>\d)/(?P<den>\d))?\s*([|\[\]].*[|\[\]])$"),
         "section": {
             "name": re.compile(r"\[(?P<name>.*?)\](?:\s*x(?P<rep>\d+))?"),
             "rarrow": re.compile(r"->"),
+        },
+        "row": {
+            "measure": re.compile(r"(?:\d/\d\s+)?[|\[\]][^|\[\]]*"),
+            # a case text in brackets, or a run of non-space characters
+            "token": re.compile(r"{[^}]*}|(?:[^\s{]|{(?![^}]*}))+"),
+            "time": re.compile(r"\d/\d"),
+            "pause": re.compile(r"-(\d+)-"),
+            "size": re.compile(r"\.(i?[ls])"),
         }
     }
 
+    barline_kind = {
+        '|': '',
+        '[': 'double-start',
+        ']': 'double-end',
+    }
+
     @staticmethod
     def parse_row(text):
-        measures = re.findall(r"(?:\d/\d\s+)?[|\[\]][^|\[\]]*", text)
+        rx = GridProcessor.re["row"]
+        measures = rx["measure"].findall(text)
         measures[-2] += measures[-1]
         measures.pop(-1)
-        out = []
-        for measure in measures:
-            re_case = re.compile(r'({.*?})')  # split case test in brackets, where spaces should be keept
-            temp = re.split(re_case, measure)
-            tokens = []
-            bb = BarBlock()
-            for s in temp:
-                s = s.strip()
-                if re_case.match(s) is None:
-                    tokens += re.split('\s+', s)  # split by spaces
-                else:
-                    tokens.append(s)
-            #             tokens = [x for x in tokens if x]
-            for tk in tokens:
-                if tk == '':
-                    continue
-                m_time = re.match(r"(\d)/(\d)", tk)
-                m_case = re_case.match(tk)
-                m_pause = re.match(r'-(\d+)-', tk)
-                m_penta = re.match(r'==+', tk)
-                m_same = re.match(r'%', tk)
-                m_size = re.match(r'\.(i?[ls])', tk)
-                m_emptychord = re.match(r'-', tk)
-                m_barline = re.match(r"(?P<rep1>[:])?(?P<kind>[|\[\]])(?P<rep2>[:])?", tk)
-                if tk == ":":
-                    bb.bar.append(Repeat())
-                elif m_barline:
-                    if m_barline.group("rep1"):
-                        bb.bar.append(Repeat())
-
-                    if m_barline.group("kind") == '|':
-                        bb.bar.append(Barline())
-                    elif m_barline.group("kind") == '[':
-                        bb.bar.append(Barline("double-start"))
-                    elif m_barline.group("kind") == ']':
-                        bb.bar.append(Barline("double-end"))
-
-                    if m_barline.group("rep2"):
-                        bb.bar.append(Repeat())
-                elif m_time is not None:
-                    bb.bar.append(Time(m_time.group(1), m_time.group(2)))
-                elif m_case is not None:
-                    bb.case = Case(m_case.groups()[0][1:-1])
-                elif m_pause is not None:
-                    bb.bar.append(Pause(m_pause.groups()[0]))
-                    bb.size = "short"  # make the measure smaller
-                elif m_penta is not None:
-                    bb.bar.append(Pentagram())
-                    bb.bar.append(EmptyChord())
-                elif m_emptychord is not None:
-                    bb.bar.append(EmptyChord())
-                elif m_same is not None:
-                    bb.bar.append(SameMeasure())
-                elif m_size is not None:
-                    if m_size.group(1).lower() == 'l':
-                        bb.size = "long"  # make the measure smaller
-                    elif m_size.group(1).lower() == 's':
-                        bb.size = "short"  # make the measure smaller
+        # case texts in brackets are single tokens, where spaces are kept
+        token = rx["token"].findall
+        parse_measure = GridProcessor.parse_measure
+        return [parse_measure(tuple(token(measure))) for measure in measures]
 
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def parse_measure(tokens):
+        """
+        Return the BarBlock of a measure, given as the tuple of its tokens.
+
+        The measures are interned: identical measures (e.g. "| % |" or
+        "| G7 |"), in a script or across scripts, share the same BarBlock,
+        rendered once. The shared BarBlocks must not be modified.
+        See measure_cache_stats() for the hit rate of the cache.
+        """
+        rx = GridProcessor.re["row"]
+        bb = BarBlock()
+        bar = bb.bar
+        for tk in tokens:
+            # dispatch on the first character: only one pattern can apply
+            c = tk[0]
+            if tk == ':':
+                bar.append(shared_node(Repeat))
+            elif c in '|[]' or (c == ':' and len(tk) > 1 and tk[1] in '|[]'):
+                i = 0
+                if c == ':':
+                    bar.append(shared_node(Repeat))
+                    i = 1
+                bar.append(shared_node(Barline, GridProcessor.barline_kind[tk[i]]))
+                if tk[i + 1:i + 2] == ':':
+                    bar.append(shared_node(Repeat))
+            elif c.isdigit() and rx["time"].match(tk):
+                bar.append(shared_node(Time, tk[0], tk[2]))
+            elif c == '{' and tk[-1] == '}':
+                bb.case = Case(tk[1:-1])
+            elif c == '-':
+                m_pause = rx["pause"].match(tk)
+                if m_pause is not None:
+                    bar.append(shared_node(Pause, m_pause.group(1)))
+                    bb.size = "short"  # make the measure smaller
                 else:
-                    bb.bar.append(Chord(tk))
-            out.append(bb)
-        return out
+                    bar.append(shared_node(EmptyChord))
+            elif c == '=' and tk[:2] == '==':
+                bar.append(shared_node(Pentagram))
+                bar.append(shared_node(EmptyChord))
+            elif c == '%':
+                bar.append(shared_node(SameMeasure))
+            elif c == '.':
+                m_size = rx["size"].match(tk)
+                if m_size is None:
+                    bar.append(shared_node(Chord, tk))
+                elif m_size.group(1) == 'l':
+                    bb.size = "long"  # make the measure longer
+                elif m_size.group(1) == 's':
+                    bb.size = "short"  # make the measure smaller
+            else:
+                bar.append(shared_node(Chord, tk))
+        parts = []
+        emit_bar_block(bb, parts)
+        bb.html = ''.join(parts)
+        return bb
 
     def parse_section(self, text):
         section = Section()
@@ -455,136 +694,683 @@ class GridProcessor:
             section.children.append(SectionComment(' '.join(comment)))
         return section
 
+    # the only line kinds that can match a line starting with a given character
+    line_kinds = {
+        '#': ("title", "subtitle"),
+        'a': ("author",),
+        'A': ("author",),
+        'c': ("copyright",),
+        'C': ("copyright",),
+        '%': ("vspace",),
+        '-': ("sections-line",),
+        '|': ("grid-row",),
+        '[': ("grid-row",),
+        ']': ("grid-row",),
+        '<': ("tag",),
+    }
+
+    @staticmethod
+    def strip_comment(line):
+        """Remove the comment (starting at the last "//") from a line."""
+        pos = line.rfind('//')
+        if pos >= 0:
+            return line[:pos]
+        return line
+
+    def classify_line(self, line):
+        """
+        Return the kind of a stripped non-empty line and its match object,
+        or (None, None) if the line is not recognized.
+        """
+        c = line[0]
+        kinds = self.line_kinds.get(c, ("grid-row",) if c.isdigit() else ())
+        for kind in kinds:
+            m = self.re[kind].match(line)
+            if m:
+                return kind, m
+        return None, None
+
+    def parse_line(self, line):
+        """
+        Parse a single line of script.
+
+        The parsing of a line does not depend on the other lines.
+        Return None for empty lines, a (field, text) tuple for the lines
+        that set a field of Grid.info and a (None, node) tuple for the lines
+        that produce a node of Grid.tree.
+        """
+        line = self.strip_comment(line).strip()
+        if not line:
+            return None  # skip empty lines
+
+        kind, m = self.classify_line(line)
+
+        if kind in ("title", "subtitle", "author", "copyright"):
+            return kind, m.group(1).strip()
+        elif kind == "vspace":
+            return None, Vspace(m.group(1).strip().lower())
+        elif kind == "sections-line":
+            text = m.group(1).strip()
+            return None, self.parse_section(text)
+        elif kind == "grid-row":
+            gridRow = GridRow()
+            gridRow.children = self.parse_row(m.group(0))
+            return None, gridRow
+        elif kind == "tag":
+            return None, Element(m.group(0))
+        else:
+            return None, NotRecognized(line)
+
+    def read_info(self, lines):
+        """
+        Return the header fields of the script lines (as Grid.info), without
+        parsing the other lines.
+        """
+        info = dict.fromkeys(Grid.info)
+        for line in lines:
+            line = line.lstrip()
+            if not line or line[0] not in "#aAcC":
+                continue
+            line = self.strip_comment(line).strip()
+            kind, m = self.classify_line(line)
+            if kind in info:
+                info[kind] = m.group(1).strip()
+        return info
+
+    def iter_nodes(self, lines):
+        """
+        Parse the script lines lazily, yielding the nodes of Grid.tree one
+        at a time. The header fields are skipped (see read_info).
+        """
+        for line in lines:
+            parsed = self.parse_line(line)
+            if parsed is not None and parsed[0] is None:
+                yield parsed[1]
+
     def run(self, lines):
+        """
+        Parse the script lines and return their Grid. The tree is read-only
+        (see parse).
+        """
         g = Grid()
 
         for line in lines:
-
-            # remove comments
-            m_comment = self.re["comment"].match(line)
-            if m_comment:
-                line = m_comment.group(1)
-
-            line = line.strip()
-            if not line:
-                continue  # skip empty lines
-
-            m_title = self.re["title"].match(line)
-            m_subtl = self.re["subtitle"].match(line)
-            m_author = self.re["author"].match(line)
-            m_copyright = self.re["copyright"].match(line)
-            m_vspace = self.re["vspace"].match(line)
-            m_sectn = self.re["sections-line"].match(line)
-            m_grrow = self.re["grid-row"].match(line)
-            m_tag= self.re["tag"].match(line)
-
-            if m_title:
-                g.info['title'] = m_title.group(1).strip()
-            elif m_subtl:
-                g.info['subtitle'] = m_subtl.group(1).strip()
-            elif m_author:
-                g.info['author'] = m_author.group(1).strip()
-            elif m_copyright:
-                g.info['copyright'] = m_copyright.group(1).strip()
-            elif m_vspace:
-                vspace = Vspace(m_vspace.group(1).strip().lower())
-                g.tree.append(vspace)
-            elif m_sectn:
-                text = m_sectn.group(1).strip()
-                g.tree.append(self.parse_section(text))
-            elif m_grrow:
-                gridRow = GridRow()
-                gridRow.children = self.parse_row(m_grrow.group(0))
-                g.tree.append(gridRow)
-            elif m_tag:
-                e = Element()
-                e.html_text=m_tag.group(0)
-                g.tree.append(e)
+            parsed = self.parse_line(line)
+            if parsed is None:
+                continue
+            field, value = parsed
+            if field:
+                g.info[field] = value
             else:
-                g.tree.append(NotRecognized(line))
+                g.tree.append(value)
 
         return g
 
 
-class CustomHandler(SimpleHTTPRequestHandler):
-    # disable logging
-    # override the logging method of the handler
+def measure_cache_stats():
+    """
+    Return the statistics of the cache of the interned measures (see
+    GridProcessor.parse_measure): its hits, misses, size, maximum size and
+    hit rate.
+    """
+    info = GridProcessor.parse_measure.cache_info()
+    lookups = info.hits + info.misses
+    return {"hits": info.hits, "misses": info.misses, "size": info.currsize, "max_size": info.maxsize,
+            "hit_rate": info.hits / lookups if lookups else 0.0}
 
-    watcher = None
 
-    def log_message(self, format, *args):
-        return
+class CompileProfile:
+    """
+    The durations (in seconds) of the stages of a compilation, and the
+    counts of the compiled items (lines, rows...).
+    """
+    def __init__(self):
+        self.time = time()
+        self.stages = {}
+        self.counts = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + perf_counter() - start
+
+    def count_grid(self, g):
+        """
+        Count the rows, bars and tokens (leaves of the rows) of a grid.
+        """
+        def leaves(node):
+            if isinstance(node, ElementGroup):
+                return sum(leaves(child) for child in node.children if child is not None)
+            return 1
+
+        rows = [node for node in g.tree if isinstance(node, GridRow)]
+        self.counts["rows"] = len(rows)
+        self.counts["bars"] = sum(len(row.children) for row in rows)
+        self.counts["tokens"] = sum(leaves(row) for row in rows)
 
-    def do_GET(self):
-        if self.path == "/is_changed/":
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps({'is_changed': self.watcher.is_changed}).encode())
+    @property
+    def total(self):
+        return sum(self.stages.values())
 
-            self.watcher.is_changed = False
-            return
-        else:
-            super(CustomHandler, self).do_GET()
+    def to_dict(self):
+        return {"time": self.time, "total": self.total, "stages": self.stages, "counts": self.counts}
 
+    def __str__(self):
+        total = self.total or 1
+        out = [f"{name:12} {duration * 1000:10.3f} ms {duration / total * 100:6.1f} %"
+               for name, duration in self.stages.items()]
+        out.append(f"{'total':12} {self.total * 1000:10.3f} ms")
+        out.append(', '.join(f"{name} {count}" for name, count in self.counts.items()))
+        return '\n'.join(out)
 
-class ThreadedServer(threading.Thread):
-    def __init__(self, watcher, port=8000):
-        self.httpd = None
-        self.port = port
-        CustomHandler.watcher = watcher
-        self.handler = CustomHandler
 
-        while self.httpd is None:
-            try:
-                self.httpd = HTTPServer(('localhost', self.port), self.handler)
-                super().__init__()
-            except OSError:
-                self.port += 1
+@contextmanager
+def atomic_open(filename, mode='w', encoding='utf-8'):
+    """
+    Open a temporary file next to filename for writing, and rename it to
+    filename once it is closed, so that the readers of filename (a browser,
+    an external previewer) never see a partially written file. The
+    temporary file is removed if the writing fails.
+    """
+    directory, name = os.path.split(os.path.abspath(filename))
+    # not the secrets module, slow to import for a one-shot compilation
+    tmp = os.path.join(directory, f'.{name}.{os.urandom(4).hex()}.tmp')
+    # created with the default permissions, unlike tempfile.mkstemp
+    f = open(tmp, mode.replace('w', 'x'), encoding=None if 'b' in mode else encoding)
+    try:
+        with f:
+            yield f
+        os.replace(tmp, filename)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def parse(text):
+    """
+    Parse the script text and return its Grid.
+
+    parse() and compile_string() can be called concurrently from many
+    threads. The tree of the grid is read-only: its bar blocks and leaves
+    are interned (see GridProcessor.parse_measure and shared_node) and
+    shared by all the grids of the process. Build new nodes to change it
+    (see transpose.transpose_node).
+    """
+    # iterate over the lines with the universal newlines, like open()
+    return GridProcessor().run(io.StringIO(text, newline=None))
+
+
+def compile_string(text, live_server_addr=None, key=None):
+    """
+    Compile the script text and return the HTML page, with the chords
+    transposed to key if given (see transpose.resolve_key).
+    """
+    g = parse(text)
+    if key:
+        from .transpose import transpose
+        g = transpose(g, key)
+    return g.to_html(live_server_addr=live_server_addr)
+
+
+def compile_mmd(filename, out_filename="index.html", live_server_addr=None, profile=None, cache=None,
+                key=None):
+    """
+    Compile the script filename to the HTML file out_filename.
 
-    def run(self):
-        log("Server running.\n" \
-            f"Open this address (http://localhost:{self.port}) in a web browser to see your grid")
-        self.httpd.serve_forever()
-        self.handler
-        log("Server terminated")
+    profile is an optional CompileProfile, that records the duration of
+    each stage. The HTML is then rendered in memory before being written,
+    to time the rendering and the writing separately.
 
-    def stop_server(self):
-        self.httpd.shutdown()
-        self.httpd.socket.close()
+    cache is an optional cache.GridCache: the grid is loaded from it when the
+    script was already parsed, and stored in it otherwise.
 
+    key is an optional key to transpose the chords to (see
+    transpose.resolve_key).
+    """
+    stage = profile.stage if profile else lambda name: nullcontext()
 
-def compile_mmd(filename, out_filename="index.html", live_server_addr=None):
     # open mmd script
-    with open(filename, "r", encoding='utf-8') as f:
-        mmd = f.readlines()
+    with stage("read"):
+        with open(filename, "r", encoding='utf-8') as f:
+            mmd = f.readlines()
 
     # read it
-    gp = GridProcessor()
-    g = gp.run(mmd)
+    g = None
+    if cache is not None:
+        text = ''.join(mmd)
+        with stage("cache"):
+            g = cache.get(text)
+    if g is None:
+        measures = GridProcessor.parse_measure.cache_info()
+        with stage("parse"):
+            gp = GridProcessor()
+            g = gp.run(mmd)
+        if profile:
+            after = GridProcessor.parse_measure.cache_info()
+            profile.counts["shared_measures"] = after.hits - measures.hits
+            profile.counts["parsed_measures"] = after.misses - measures.misses
+        if cache is not None:
+            with stage("cache"):
+                cache.put(text, g)
+
+    if key:
+        from .transpose import transpose
+        with stage("transpose"):
+            g = transpose(g, key)
 
     # write html
-    with open(out_filename, 'w', encoding='utf-8') as f:
-        f.write(g.to_html(live_server_addr=live_server_addr))
+    if profile:
+        with stage("resources"):
+            load_resource('musicgrid.css')
+            if live_server_addr is not None:
+                load_resource('musicgrid.js')
+        with stage("render"):
+            html = g.to_html(live_server_addr=live_server_addr)
+        with stage("write"):
+            with atomic_open(out_filename) as f:
+                f.write(html)
+        profile.counts["lines"] = len(mmd)
+        profile.count_grid(g)
+    else:
+        with atomic_open(out_filename) as f:
+            g.write_html(f, live_server_addr=live_server_addr)
+
+
+def compile_stream(f, out, live_server_addr=None):
+    """
+    Compile the script read from the text file object f to the text file
+    object out, one line at a time: each line is parsed, rendered and
+    written before the next one is read, so that the memory used does not
+    depend on the size of the script.
+
+    The header fields are read in a first pass over f. If f cannot seek
+    back (e.g. a pipe), it is first copied to a temporary file.
+    """
+    import shutil
+    import tempfile
+
+    spool = None
+    if not f.seekable():
+        spool = tempfile.TemporaryFile("w+", encoding="utf-8")
+        shutil.copyfileobj(f, spool)
+        spool.seek(0)
+        f = spool
+    try:
+        gp = GridProcessor()
+        g = Grid()
+        start = f.tell()
+        g.info = gp.read_info(f)
+        f.seek(start)
+        tree_html = (node.to_html() for node in gp.iter_nodes(f))
+        out.writelines(g.iter_html(live_server_addr=live_server_addr, tree_html=tree_html))
+    finally:
+        if spool is not None:
+            spool.close()
+
+
+# placeholder after the first page of a paginated preview, where the next
+# pages are inserted by musicgrid.js as it comes into view
+PAGER = '<div class="pager" style="height: 1px" data-next="1" data-pages="{pages}"></div>'
+
+
+def render_page(g, rows_per_page, index=None, live_server_addr=None, tree_html=None, version=None):
+    """
+    Render the grid g split in pages (see Grid.page_ranges), for a
+    paginated preview.
+
+    If index is None, return the HTML document with the first page only,
+    followed by a placeholder to load the next ones. Else return the HTML
+    of the nodes of the page index, or raise IndexError if there is no such
+    page. tree_html is an optional list with the already rendered HTML of
+    the nodes of g.tree, version the version of the page (see Grid.iter_html).
+    """
+    ranges = g.page_ranges(rows_per_page)
+
+    def nodes_html(start, end):
+        if tree_html is not None:
+            return tree_html[start:end]
+        return [node.to_html() for node in g.tree[start:end]]
+
+    if index is None:
+        html = nodes_html(*ranges[0])
+        if len(ranges) > 1:
+            html.append(PAGER.format(pages=len(ranges)))
+        return g.to_html(live_server_addr=live_server_addr, tree_html=html, version=version)
+    if not 0 <= index < len(ranges):
+        raise IndexError(f"no page {index}, the script has {len(ranges)} pages")
+    return ''.join('\n' + html for html in nodes_html(*ranges[index]))
+
+
+class Page:
+    """
+    A compiled HTML page kept in memory, ready to be served over HTTP.
+    """
+    def __init__(self, html):
+        import gzip
+        import hashlib
+
+        self.body = html.encode('utf-8')
+        self.etag = '"' + hashlib.sha256(self.body).hexdigest()[:32] + '"'
+        # the default level 9 takes 4 times longer, for a 20 % smaller page:
+        # the page is compressed after each modification of the script
+        self.gzip_body = gzip.compress(self.body, compresslevel=6, mtime=0)
+
+
+class CompileCancelled(Exception):
+    """A compilation was superseded by a newer modification of the script."""
 
 
 class Watcher(threading.Thread):
     # check if a file has changed and recompile it
-    def __init__(self, filename):
-        self.is_changed = False
+    #
+    # The compilations run in a separate thread (compile_loop): a
+    # modification of the script during a compilation cancels it, and the
+    # script is compiled again. The output file is replaced atomically, and
+    # the clients are notified once it is in place.
+    def __init__(self, filename, out_filename="index.html", debounce=0.1):
+        # incremented after each compilation, waited for with self.changed;
+        # the version is written in the page (see Grid.iter_html)
+        self.version = 0
+        self.changed = threading.Condition()
         self.filename = filename
+        self.out_filename = out_filename
+        # seconds without modifications after which a change is compiled
+        self.debounce = debounce
         self.stop = False
         self.live_server_addr = None
+        # keep the compiled page in memory (self.page), for the live server;
+        # the output file is then written only if out_filename is not None
+        self.in_memory = False
+        self.page = None
+        # (from version, to version, JSON patch) of the last recompilation, see make_patch
+        self.patch = None
+        # maximum number of changed nodes of a patch, beyond which the page is reloaded
+        self.patch_window = 500
+        self.processor = GridProcessor()
+        # result of the last compilation
+        self.lines = []
+        self.grid = None
+        self.tree_html = []
+        # parsed line -> [parse_line result, node HTML], for the lines of the last compilation
+        self.line_cache = {}
+        # split the preview in pages of page_rows grid rows (see render_page)
+        self.page_rows = None
+        # (grid, tree_html, version, {((semitones, flats) or None, page index or
+        # None): Page}) of the last compilation: the pages requested to get_page
+        self.key_pages = (None, None, 0, {})
+        # CompileProfile.to_dict() of the last compilations
+        self.stats = deque(maxlen=20)
+        self.print_profile = False
+        # number of compilations requested, and of the last one completed or
+        # cancelled, waited for with self.requests
+        self.requested = 0
+        self.handled = 0
+        self.requests = threading.Condition()
         super(Watcher, self).__init__()
 
-    def run(self, live_server_addr=None):
-        compile_mmd(self.filename, live_server_addr=self.live_server_addr)
-        mtime = os.stat(self.filename).st_mtime
+    def compile(self, request=None):
+        """
+        Recompile the script, parsing and rendering only the lines that
+        changed since the last compilation.
+
+        If request is given, raise CompileCancelled as soon as a newer
+        compilation is requested (see request_compile). The result of the
+        compilation (self.page, self.grid...) is only replaced once the
+        output file is written, then the clients are notified (see
+        notify_change).
+
+        The durations of the stages are recorded in self.stats.
+        """
+        def check():
+            if request is not None and self.requested != request:
+                raise CompileCancelled()
+
+        profile = CompileProfile()
+
+        with profile.stage("read"):
+            with open(self.filename, "r", encoding='utf-8') as f:
+                lines = f.readlines()
+        check()
+
+        # parsed line -> [parse_line result, node HTML]
+        line_cache = {}
+        new_entries = []
+        with profile.stage("parse"):
+            for line in lines:
+                if line in line_cache:
+                    continue
+                entry = self.line_cache.get(line)
+                if entry is None:
+                    entry = [self.processor.parse_line(line), None]
+                    new_entries.append(entry)
+                    if len(new_entries) % 1000 == 0:
+                        check()
+                line_cache[line] = entry
+        check()
+
+        with profile.stage("render"):
+            for entry in new_entries:
+                parsed = entry[0]
+                if parsed is not None and parsed[0] is None:
+                    entry[1] = parsed[1].to_html()
+
+            g = Grid()
+            tree_html = []
+            for line in lines:
+                parsed, html = line_cache[line]
+                if parsed is None:
+                    continue
+                field, value = parsed
+                if field:
+                    g.info[field] = value
+                else:
+                    g.tree.append(value)
+                    tree_html.append(html)
+
+        patch = None
+        # only this thread changes the version
+        version = self.version + 1
+        if self.in_memory:
+            # a paginated preview is served by get_page only, one page at a time:
+            # the whole document is rendered only for the output file
+            page = None
+            if not self.page_rows or self.out_filename:
+                with profile.stage("render"):
+                    html = g.to_html(live_server_addr=self.live_server_addr, tree_html=tree_html, version=version)
+            if not self.page_rows:
+                with profile.stage("page"):
+                    page = Page(html)
+                # the nodes of a paginated preview are not all in the page
+                with profile.stage("patch"):
+                    patch = self.make_patch(g, tree_html)
+            check()
+            if self.out_filename:
+                with profile.stage("write"):
+                    with atomic_open(self.out_filename) as f:
+                        f.write(html)
+        else:
+            check()
+            # the HTML is streamed to the file: rendering and writing are timed together
+            with profile.stage("write"):
+                with atomic_open(self.out_filename) as f:
+                    g.write_html(f, live_server_addr=self.live_server_addr, tree_html=tree_html)
+
+        self.lines = lines
+        self.grid = g
+        self.tree_html = tree_html
+        self.line_cache = line_cache
+        with self.changed:
+            # a client never gets a page with the version of another one
+            if self.in_memory:
+                self.page = page
+                self.key_pages = (g, tree_html, version, {})
+            self.notify_change(patch)
+
+        profile.counts["lines"] = len(lines)
+        profile.counts["parsed_lines"] = len(new_entries)
+        profile.counts["nodes"] = len(g.tree)
+        self.stats.append(profile.to_dict())
+        if self.print_profile:
+            print(profile)
+
+    def get_page(self, key=None, index=None):
+        """
+        Return the page of the last compilation, with the chords transposed
+        to key if given. Raise ValueError for an invalid key.
+
+        If self.page_rows is set, the preview is paginated: return the first
+        page, or the nodes of the page index (see render_page).
+
+        The transposed pages and the pages of a paginated preview are cached
+        until the next compilation.
+        """
+        if index is not None and not self.page_rows:
+            raise IndexError("the preview is not paginated")
+        if not key and not self.page_rows:
+            return self.page
+
+        # the grid and its pages are replaced together by compile()
+        g, tree_html, version, pages = self.key_pages
+        if g is None:
+            return None
+        transposition = None
+        if key:
+            from .transpose import resolve_key
+            transposition = resolve_key(g, key)
+        page = pages.get((transposition, index))
+        if page is None:
+            if transposition:
+                from .transpose import transpose_grid
+                g = transpose_grid(g, *transposition)
+                tree_html = None
+            if self.page_rows:
+                html = render_page(g, self.page_rows, index, live_server_addr=self.live_server_addr,
+                                   tree_html=tree_html, version=version)
+            else:
+                html = g.to_html(live_server_addr=self.live_server_addr, version=version)
+            page = pages[(transposition, index)] = Page(html)
+        return page
+
+    def make_patch(self, g, tree_html):
+        """
+        Compare the new grid g with the one of the last compilation.
+
+        Return a JSON patch that turns the top-level nodes of the old page
+        into the new ones: {"count": number of old nodes, "ops": [[start,
+        end, html], ...]}, where each op replaces the old nodes start:end
+        with the given HTML. Return None if the page must be reloaded
+        (header changed, raw HTML tags that may not be single elements, or
+        more than self.patch_window changed nodes).
+
+        The nodes before the first change and after the last one are
+        skipped before comparing the others: the comparison takes a time
+        quadratic in their number on repetitive scripts.
+        """
+        from difflib import SequenceMatcher
+        import json
+
+        old = self.grid
+        if old is None or old.info != g.info:
+            return None
+        if any(type(node) is Element for node in old.tree + g.tree):
+            return None
+
+        old_html = self.tree_html
+        # common prefix and suffix (the HTML of an unchanged line is the same string)
+        start = 0
+        end = min(len(old_html), len(tree_html))
+        while start < end and old_html[start] == tree_html[start]:
+            start += 1
+        old_end, new_end = len(old_html), len(tree_html)
+        while old_end > start and new_end > start and old_html[old_end - 1] == tree_html[new_end - 1]:
+            old_end -= 1
+            new_end -= 1
+        if max(old_end, new_end) - start > self.patch_window:
+            return None
+
+        matcher = SequenceMatcher(None, old_html[start:old_end], tree_html[start:new_end], autojunk=False)
+        ops = [[start + i1, start + i2, '\n'.join(tree_html[start + j1:start + j2])]
+               for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != 'equal']
+        return json.dumps({"count": len(old_html), "ops": ops})
+
+    def notify_change(self, patch=None):
+        """
+        Increment the version and wake up all the threads waiting for a
+        recompilation. patch is the JSON patch from the previous version,
+        if any.
+        """
+        with self.changed:
+            self.version += 1
+            self.patch = (self.version - 1, self.version, patch) if patch else None
+            self.changed.notify_all()
+
+    def wait_change(self, version, timeout=None):
+        """
+        Wait for a recompilation after the given version, at most timeout
+        seconds. Return the current version.
+        """
+        with self.changed:
+            self.changed.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+    def request_compile(self):
+        """
+        Ask the compile thread to compile the script, cancelling the
+        compilation in progress if any.
+        """
+        with self.requests:
+            self.requested += 1
+            self.requests.notify_all()
+
+    def compile_loop(self):
+        """
+        Compile the script each time it is requested, until self.stop.
+        """
         while True:
-            if self.stop: break
-            if os.stat(self.filename).st_mtime != mtime:
-                mtime = os.stat(self.filename).st_mtime
-                compile_mmd(self.filename, live_server_addr=self.live_server_addr)
-                self.is_changed = True
-            sleep(0.2)
+            with self.requests:
+                self.requests.wait_for(lambda: self.stop or self.requested != self.handled)
+                if self.stop:
+                    return
+                request = self.requested
+            try:
+                self.compile(request)
+            except CompileCancelled:
+                continue
+            except Exception:
+                logger.exception("compilation of %s failed", self.filename)
+                self.mark_handled(request)
+                continue
+            self.mark_handled(request)
+
+    def mark_handled(self, request):
+        with self.requests:
+            self.handled = request
+            self.requests.notify_all()
 
+    def run(self, live_server_addr=None):
+        from .filewatch import open_watch
+
+        watch = open_watch(self.filename)
+        compiler = threading.Thread(target=self.compile_loop, name="musicmd-compile", daemon=True)
+        compiler.start()
+        self.request_compile()
+        try:
+            while not self.stop:
+                # wake up regularly to check self.stop
+                if watch.wait(timeout=0.5):
+                    # an editor save can produce a burst of events:
+                    # wait until the file is quiet to compile once
+                    while watch.wait(timeout=self.debounce):
+                        pass
+                    self.request_compile()
+        finally:
+            watch.close()
+            with self.requests:
+                self.stop = True
+                self.requests.notify_all()
@@ -1,34 +1,126 @@
 import argparse
-from .__init__ import Watcher, ThreadedServer, compile_mmd
+from . import Watcher, CompileProfile, compile_mmd, compile_stream, atomic_open
 import logging
 import os
+import sys
 
 if __name__ == "__main__":
-    logging.getLogger('musicmd.__init__').setLevel(logging.CRITICAL)
+    logging.getLogger('musicmd').setLevel(logging.CRITICAL)
     logger = logging.getLogger(__name__)
     # for key in logging.Logger.manager.loggerDict:
     #     print(key)
 
     parser = argparse.ArgumentParser(prog="musicmd", description='Compile a mmd script to html')
-    parser.add_argument('file', help='The mmd script file that will be compiled')
-    parser.add_argument('-o', '--output', help='Name of the output HTML file', default='index.html')
+    parser.add_argument('file', help='The mmd script file that will be compiled '
+                                     '(with build: a directory or a glob pattern of script files, '
+                                     'with serve: a script file or a directory)')
+    parser.add_argument('-o', '--output', help='Name of the output HTML file ("-" for the standard output with --stream; '
+                                               'default: index.html, or the script name with --export)')
+    parser.add_argument('--export', choices=['json', 'binary'],
+                        help='Write the syntax tree of the script (see musicmd.serialize) instead of the HTML')
+    parser.add_argument('-k', '--key',
+                        help='Transpose the chords to the key KEY (e.g. "Bb" or "F#m") '
+                             'or by KEY semitones (e.g. "+2" or "-3")')
+    parser.add_argument('--stream', action='store_true',
+                        help='Compile the script line by line, with a constant memory usage '
+                             '(implied when the file is "-", the standard input)')
+    parser.add_argument('--profile', action='store_true',
+                        help='Print the duration of each compilation stage')
+    parser.add_argument('--cprofile', metavar='FILE',
+                        help='Save the cProfile statistics of the compilation in FILE')
 
     sp = parser.add_subparsers(title="optional commands", dest="command")
     serve = sp.add_parser('serve', help='Start a live web-server and preview the compiled script')
+    serve.add_argument('--no-write', action='store_true',
+                       help='Do not write the output HTML file, only serve it from memory')
+    serve.add_argument('--cache-size', type=int, default=32,
+                       help='With a directory: number of compiled scripts kept in memory')
+    serve.add_argument('-p', '--pattern', default='*.txt', help='With a directory: pattern of the script files')
+    serve.add_argument('--paginate', type=int, nargs='?', const=100, metavar='ROWS',
+                       help='Split the preview in pages of about ROWS grid rows (default: 100), cut at the '
+                            'sections and vertical spaces, loaded as the page is scrolled')
     watch = sp.add_parser('watch', help='Recompile as file is modified')
+    build = sp.add_parser('build', help='Compile all the scripts of a directory or glob pattern in parallel')
+    build.add_argument('-j', '--jobs', type=int, help='Number of worker processes (default: number of CPUs)')
+    build.add_argument('-d', '--output-dir', help='Directory of the output HTML files (default: next to the scripts)')
+    build.add_argument('-p', '--pattern', default='*.txt', help='Pattern of the script files in a directory')
+    build.add_argument('-f', '--force', action='store_true', help='Compile also the scripts that are up to date')
+    build.add_argument('--cache-dir', help='Directory of the cache of the parsed scripts '
+                                           '(default: $XDG_CACHE_HOME/musicmd or ~/.cache/musicmd)')
+    build.add_argument('-s', '--songbook', metavar='FILE',
+                       help='Compile all the scripts in the single HTML file FILE, with a table of contents')
+    build.add_argument('-t', '--title', help='With --songbook: title of the songbook')
+    build.add_argument('--cache-max-size', type=float, default=100,
+                       help='Maximum size of the cache in MiB, 0 disables the cache (default: 100)')
 
     # n = parser.parse_args('script.txt serve'.split())
     n = parser.parse_args()
     # watch.parse_args()
     # print(n)
 
-    if not os.path.exists(n.file):
+    if n.file == "-" and n.command is not None:
+        print(f"ERROR: the standard input cannot be used with {n.command}")
+        exit(1)
+
+    if n.output is None:
+        n.output = 'index.html'
+        if n.export:
+            n.output = os.path.splitext(n.file)[0] + ('.json' if n.export == 'json' else '.mmdg')
+
+    if n.export and (n.command is not None or n.stream or n.file == "-"):
+        print("ERROR: --export cannot be used with a command or with --stream")
+        exit(1)
+
+    if n.key and n.command is not None:
+        print(f"ERROR: --key cannot be used with {n.command} (add ?key=KEY to the address of the preview)")
+        exit(1)
+
+    if n.command != "build" and n.file != "-" and not os.path.exists(n.file):
         print(f"ERROR: file {n.file} not found in the current directory")
         exit(1)
 
-    if n.command == "serve":
-        w = Watcher(n.file)
-        t = ThreadedServer(w, port=8000)
+    if n.command == "build":
+        from .build import find_scripts, build
+        scripts = find_scripts(n.file, n.pattern)
+        if not scripts:
+            print(f"ERROR: no script found in {n.file}")
+            exit(1)
+        cache = None
+        if n.cache_max_size > 0:
+            from .cache import GridCache
+            cache = GridCache(n.cache_dir, max_size=int(n.cache_max_size * 1024 * 1024))
+        if n.songbook:
+            from time import perf_counter
+            from .build import compile_songbook
+            start = perf_counter()
+            compile_songbook(scripts, n.songbook, title=n.title, cache=cache)
+            if cache is not None:
+                cache.evict()
+            print(f"{len(scripts)} scripts compiled in {n.songbook} in {perf_counter() - start:.2f} s")
+            exit(0)
+        summary = build(scripts, out_dir=n.output_dir, jobs=n.jobs, force=n.force, cache=cache)
+        for filename, error in summary["failed"].items():
+            print(f"ERROR: {filename}: {error}")
+        seconds = summary["seconds"]
+        print(f"{summary['compiled']} compiled, {summary['skipped']} up to date, "
+              f"{len(summary['failed'])} failed in {seconds:.2f} s", end='')
+        if seconds > 0:
+            print(f" ({summary['compiled'] / seconds:.1f} scripts/s, "
+                  f"{summary['bytes'] / seconds / 1024:.1f} KiB/s)")
+        else:
+            print()
+        if summary["failed"]:
+            exit(1)
+    elif n.command == "serve":
+        from .server import ThreadedServer  # imported only when needed, for a fast start-up
+        if os.path.isdir(n.file):
+            from .songbook import Songbook, SongbookHandler
+            w = Songbook(n.file, cache_size=n.cache_size, pattern=n.pattern)
+            t = ThreadedServer(w, port=8000, handler=SongbookHandler)
+        else:
+            w = Watcher(n.file, out_filename=None if n.no_write else n.output)
+            t = ThreadedServer(w, port=8000)
+        w.page_rows = n.paginate
         t.start()
         w.live_server_addr = f'http://localhost:{t.port}'
         w.start()
@@ -40,7 +132,8 @@ if __name__ == "__main__":
             t.stop_server() # stop the server
             w.stop = True  # kill the watcher
     elif n.command == "watch":
-        w = Watcher(n.file)
+        w = Watcher(n.file, out_filename=n.output)
+        w.print_profile = n.profile
         w.start()
         print("Watching modifications to the script file.")
         try:
@@ -48,6 +141,52 @@ if __name__ == "__main__":
                 input("Kill the process to stop (Ctrl+C)")
         except KeyboardInterrupt:
             w.stop = True # kill the watcher
+    elif n.key and (n.stream or n.file == "-"):
+        print("ERROR: --key cannot be used with --stream")
+        exit(1)
+    elif n.export:
+        from . import parse, serialize
+        with open(n.file, "r", encoding='utf-8') as f:
+            g = parse(f.read())
+        if n.key:
+            from .transpose import transpose
+            try:
+                g = transpose(g, n.key)
+            except ValueError as e:
+                print(f"ERROR: {e}")
+                exit(1)
+        data = serialize.dumps(g, binary=n.export == 'binary')
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        if n.output == "-":
+            sys.stdout.buffer.write(data)
+        else:
+            with atomic_open(n.output, "wb") as f:
+                f.write(data)
+    elif n.stream or n.file == "-":
+        infile = sys.stdin if n.file == "-" else open(n.file, "r", encoding='utf-8')
+        try:
+            if n.output == "-":
+                compile_stream(infile, sys.stdout)
+            else:
+                with atomic_open(n.output) as outfile:
+                    compile_stream(infile, outfile)
+        finally:
+            if infile is not sys.stdin:
+                infile.close()
     else:
-        compile_mmd(n.file, out_filename=n.output)
+        profile = CompileProfile() if n.profile else None
+        try:
+            if n.cprofile:
+                import cProfile
+                profiler = cProfile.Profile()
+                profiler.runcall(compile_mmd, n.file, out_filename=n.output, profile=profile, key=n.key)
+                profiler.dump_stats(n.cprofile)
+            else:
+                compile_mmd(n.file, out_filename=n.output, profile=profile, key=n.key)
+        except ValueError as e:
+            print(f"ERROR: {e}")
+            exit(1)
+        if profile:
+            print(profile)
 
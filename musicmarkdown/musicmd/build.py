@@ -0,0 +1,173 @@
+import os
+import glob
+import html
+from time import perf_counter
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+
+from . import compile_mmd, GridProcessor, load_resource, page_head, atomic_open
+
+
+def find_scripts(source, pattern="*.txt"):
+    """
+    Return the sorted list of the scripts in the directory source that
+    match pattern, or of the files that match the glob pattern source.
+    """
+    if os.path.isdir(source):
+        source = os.path.join(source, pattern)
+    return sorted(f for f in glob.glob(source, recursive=True) if os.path.isfile(f))
+
+
+def output_filename(filename, out_dir=None, base_dir=None):
+    """
+    The HTML file compiled from a script: same name with the .html extension,
+    next to the script, or in out_dir. With base_dir, the path of the script
+    relative to base_dir is kept in out_dir, so that the scripts with the
+    same name in different directories are not compiled to the same file.
+    """
+    directory, name = os.path.split(filename)
+    name = os.path.splitext(name)[0] + '.html'
+    if not out_dir:
+        return os.path.join(directory, name)
+    if base_dir:
+        return os.path.normpath(os.path.join(out_dir, os.path.relpath(directory or '.', base_dir), name))
+    return os.path.join(out_dir, name)
+
+
+def base_directory(filenames):
+    """The deepest directory containing all the files filenames."""
+    return os.path.commonpath([os.path.dirname(os.path.abspath(f)) for f in filenames])
+
+
+def is_up_to_date(filename, out_filename):
+    return os.path.exists(out_filename) and os.stat(out_filename).st_mtime >= os.stat(filename).st_mtime
+
+
+def compile_job(filename, out_filename, cache=None):
+    # executed in the worker processes
+    try:
+        compile_mmd(filename, out_filename=out_filename, cache=cache)
+    except Exception as e:
+        return filename, 0, f"{type(e).__name__}: {e}"
+    return filename, os.path.getsize(filename), None
+
+
+def build(filenames, out_dir=None, jobs=None, force=False, cache=None):
+    """
+    Compile many scripts in a pool of `jobs` processes (default: one per CPU).
+
+    The scripts whose output is newer than the script are skipped, unless
+    force is True. cache is an optional cache.GridCache of the parsed grids,
+    shared by the workers; its least recently used entries are evicted at
+    the end of the build.
+    Return a summary dict with the number of compiled, skipped and failed
+    scripts, the total size of the compiled scripts and the elapsed time.
+    """
+    base_dir = base_directory(filenames) if out_dir and filenames else None
+
+    todo = []
+    for filename in filenames:
+        out_filename = output_filename(filename, out_dir, base_dir)
+        if force or not is_up_to_date(filename, out_filename):
+            todo.append((filename, out_filename))
+    if out_dir:
+        for directory in {os.path.dirname(out_filename) for _, out_filename in todo}:
+            os.makedirs(directory, exist_ok=True)
+
+    summary = {
+        "compiled": 0,
+        "skipped": len(filenames) - len(todo),
+        "failed": {},
+        "bytes": 0,
+        "seconds": 0.0,
+    }
+    if not todo:
+        return summary
+
+    jobs = min(jobs or os.cpu_count() or 1, len(todo))
+    # send the scripts in chunks, to limit the inter-process overhead
+    chunksize = max(1, len(todo) // (jobs * 4))
+    start = perf_counter()
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        for filename, size, error in pool.map(compile_job, *zip(*todo), repeat(cache), chunksize=chunksize):
+            if error:
+                summary["failed"][filename] = error
+            else:
+                summary["compiled"] += 1
+                summary["bytes"] += size
+    summary["seconds"] = perf_counter() - start
+    if cache is not None:
+        cache.evict()
+    return summary
+
+
+SONGBOOK_STYLE = """
+div.page + div.page {
+  margin-top: 1em;
+}
+
+ol.toc > li {
+  margin: 0.3em 0;
+}
+
+@media print {
+  div.page + div.page {
+    break-before: page;
+  }
+}
+"""
+
+
+def read_tune(filename, cache=None):
+    with open(filename, "r", encoding='utf-8') as f:
+        lines = f.readlines()
+    g = cache.get(''.join(lines)) if cache is not None else None
+    if g is None:
+        g = GridProcessor().run(lines)
+        if cache is not None:
+            cache.put(''.join(lines), g)
+    return g
+
+
+def iter_songbook(filenames, title=None, cache=None):
+    """
+    Compile the scripts filenames in a single HTML document, yielding the
+    output in fragments.
+
+    The document has a table of contents followed by one page per tune, and
+    includes the CSS only once. The tunes are parsed and rendered one at a
+    time, so that only one grid is in memory.
+    """
+    gp = GridProcessor()
+    toc = []
+    # only the header lines are parsed to write the table of contents
+    for i, filename in enumerate(filenames):
+        with open(filename, "r", encoding='utf-8') as f:
+            info = gp.read_info(f)
+        name = info["title"] or html.escape(os.path.splitext(os.path.basename(filename))[0])
+        toc.append(f'<li><a href="#tune-{i + 1}">{name}</a></li>')
+
+    yield page_head(load_resource("musicgrid.css"), SONGBOOK_STYLE)
+    yield '<div class="page">'
+    if title:
+        yield f'\n<div class="header"><h1>{html.escape(title)}</h1></div>'
+    yield '\n<ol class="toc">\n'
+    yield '\n'.join(toc)
+    yield '\n</ol>\n</div>'
+
+    for i, filename in enumerate(filenames):
+        g = read_tune(filename, cache)
+        yield f'\n<div class="page" id="tune-{i + 1}">'
+        yield from g.iter_body()
+        yield '\n</div>'
+        del g
+    yield '\n</body>\n</html>'
+
+
+def compile_songbook(filenames, out_filename, title=None, cache=None):
+    """
+    Compile the scripts filenames in the single HTML file out_filename
+    (see iter_songbook).
+    """
+    with atomic_open(out_filename) as f:
+        f.writelines(iter_songbook(filenames, title=title, cache=cache))
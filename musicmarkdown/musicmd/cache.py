@@ -0,0 +1,131 @@
+"""
+On-disk cache of the parsed grids, keyed by the hash of the script content.
+
+Recompiling an unchanged script (e.g. in a build of a whole songbook, or
+when the output HTML has been deleted) then only loads the grid and
+renders it, without parsing the script again.
+"""
+import os
+import sys
+import zlib
+import marshal
+import hashlib
+import logging
+import tempfile
+from functools import lru_cache
+
+from . import serialize
+
+logger = logging.getLogger(__name__)
+
+
+def default_directory():
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "musicmd")
+
+
+@lru_cache(maxsize=None)
+def parser_fingerprint():
+    """
+    Hash of the parser and serializer sources, so that the entries written by
+    another version of musicmd are never loaded.
+    """
+    h = hashlib.sha256()
+    h.update(f"{serialize.FORMAT} {sys.version_info[:2]}".encode())  # marshal is version specific
+    for module in (sys.modules[__package__], serialize):
+        with open(module.__file__, "rb") as f:
+            h.update(f.read())
+    return h.digest()
+
+
+class GridCache:
+    """
+    A directory of serialized grids, one file per script content.
+
+    The entries are zlib compressed marshal dumps of serialize.dump(grid).
+    When the directory grows beyond max_size bytes, evict() removes the
+    least recently used entries.
+    """
+    suffix = ".grid"
+
+    def __init__(self, directory=None, max_size=100 * 1024 * 1024):
+        self.directory = directory or default_directory()
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, text):
+        h = hashlib.sha256(parser_fingerprint())
+        h.update(text.encode("utf-8"))
+        return h.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + self.suffix)
+
+    def get(self, text):
+        """
+        Return the cached grid of the script text, or None.
+        """
+        path = self.path(self.key(text))
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            g = serialize.load(marshal.loads(zlib.decompress(data)))
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (OSError, ValueError, EOFError, TypeError, zlib.error) as e:
+            logger.warning("ignoring the corrupted cache entry %s: %s", path, e)
+            self.misses += 1
+            return None
+        try:
+            # the access time is unreliable (noatime mounts), the mtime is
+            # used for the least recently used eviction
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return g
+
+    def put(self, text, g):
+        """
+        Store the grid g parsed from the script text.
+        """
+        data = zlib.compress(marshal.dumps(serialize.dump(g)))
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # write to a temporary file and rename it, so that concurrent
+            # processes never read a partial entry
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, self.path(self.key(text)))
+        except OSError as e:
+            logger.warning("cannot write in the cache %s: %s", self.directory, e)
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache is smaller
+        than max_size. Return the number of removed entries.
+        """
+        entries = []
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if entry.name.endswith(self.suffix):
+                        st = entry.stat()
+                        entries.append((st.st_mtime, st.st_size, entry.path))
+        except FileNotFoundError:
+            return 0
+        size = sum(e[1] for e in entries)
+        removed = 0
+        for _, entry_size, path in sorted(entries):
+            if size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            size -= entry_size
+            removed += 1
+        return removed
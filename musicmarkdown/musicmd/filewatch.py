@@ -0,0 +1,171 @@
+"""
+Detection of the modifications of a file, or of the files of a directory.
+
+On Linux the modifications are notified by inotify (through ctypes),
+elsewhere the modification time of the file is polled.
+"""
+import os
+import sys
+import select
+import struct
+from time import sleep, monotonic
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class PollingWatch:
+    """
+    Detect the modifications of a file, or of the files of a directory,
+    by polling their modification time.
+    """
+    def __init__(self, path, interval=0.2):
+        self.path = path
+        self.is_dir = os.path.isdir(path)
+        self.interval = interval
+        # names of the modified files, see pop_changed
+        self.changed = set()
+        self.mtimes = self.get_mtimes()
+
+    def get_mtimes(self):
+        if self.is_dir:
+            return {e.name: e.stat().st_mtime for e in os.scandir(self.path) if e.is_file()}
+        try:
+            return {os.path.basename(self.path): os.stat(self.path).st_mtime}
+        except FileNotFoundError:
+            # the file is being replaced (e.g. saved by renaming a temp file)
+            return {}
+
+    def wait(self, timeout):
+        """
+        Wait at most timeout seconds for a modification.
+        Return True if a file was modified.
+        """
+        end = monotonic() + timeout
+        while True:
+            mtimes = self.get_mtimes()
+            changed = {name for name, mtime in mtimes.items() if mtime != self.mtimes.get(name)}
+            if self.is_dir:
+                changed.update(self.mtimes.keys() - mtimes.keys())  # deleted files
+                self.mtimes = mtimes
+            else:
+                self.mtimes.update(mtimes)
+            if changed:
+                self.changed |= changed
+                return True
+            remaining = end - monotonic()
+            if remaining <= 0:
+                return False
+            sleep(min(self.interval, remaining))
+
+    def pop_changed(self):
+        """
+        Return the names of the files modified since the last call.
+        """
+        changed, self.changed = self.changed, set()
+        return changed
+
+    def close(self):
+        pass
+
+
+class InotifyWatch:
+    """
+    Detect the modifications of a file, or of the files of a directory,
+    with the Linux inotify API.
+
+    The directory of a file is watched, so that the editors that save by
+    writing a temp file and renaming it are detected too.
+    """
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    event_header = struct.Struct('iIII')  # wd, mask, cookie, len
+
+    def __init__(self, path):
+        import ctypes
+        import ctypes.util
+
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        mask = self.IN_MODIFY | self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE
+        if os.path.isdir(path):
+            # all the files of the directory, including the deleted ones
+            directory = path
+            self.name = None
+            mask |= self.IN_DELETE | self.IN_MOVED_FROM
+        else:
+            directory = os.path.dirname(os.path.abspath(path))
+            self.name = os.fsencode(os.path.basename(path))
+        # names of the modified files, see pop_changed
+        self.changed = set()
+        self.fd = libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch failed on {directory}")
+
+    def read_events(self):
+        """
+        Read the pending events and return True if one concerns the
+        watched file(s).
+        """
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return False
+        changed = False
+        pos = 0
+        while pos < len(data):
+            wd, mask, cookie, length = self.event_header.unpack_from(data, pos)
+            pos += self.event_header.size
+            name = data[pos:pos + length].rstrip(b'\0')
+            pos += length
+            if name and (self.name is None or name == self.name):
+                self.changed.add(os.fsdecode(name))
+                changed = True
+        return changed
+
+    def wait(self, timeout):
+        """
+        Wait at most timeout seconds for a modification.
+        Return True if a file was modified.
+        """
+        end = monotonic() + timeout
+        while True:
+            remaining = end - monotonic()
+            if remaining <= 0:
+                return False
+            readable, _, _ = select.select([self.fd], [], [], remaining)
+            if readable and self.read_events():
+                return True
+
+    def pop_changed(self):
+        """
+        Return the names of the files modified since the last call.
+        """
+        changed, self.changed = self.changed, set()
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+def open_watch(path):
+    """
+    Return the best available watch of the modifications of a file or
+    directory: inotify on Linux, polling elsewhere or if inotify is not
+    available.
+    """
+    if sys.platform.startswith('linux'):
+        try:
+            return InotifyWatch(path)
+        except (OSError, AttributeError) as e:
+            logger.warning(f"inotify not available ({e}), polling instead")
+    return PollingWatch(path)
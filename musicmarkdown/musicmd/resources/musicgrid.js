@@ -1,28 +1,88 @@
-var getJSON = function(url, callback) {
-    var xhr = new XMLHttpRequest();
-    xhr.open('GET', url, true);
-    xhr.responseType = 'json';
-    xhr.onload = function() {
-      var status = xhr.status;
-      if (status === 200) {
-        callback(null, xhr.response);
-      } else {
-        callback(status, xhr.response);
-      }
-    };
-    xhr.send();
+// the server sends a message each time the script is recompiled, starting
+// from the version of this page
+var source = new EventSource(server_address + '/events/' + (page_version === null ? '' : '?since=' + page_version));
+
+source.onmessage = function (event) {
+    if (event.data === 'reload') {
+        location.reload();
+    }
 };
 
-setInterval(function () {
-    getJSON(server_address + '/is_changed/',
-        function(err, data) {
-          if (err !== null) {
-            alert('Something went wrong: ' + err);
-          } else {
-              if (data.is_changed) {
-                location.reload();
-              }
-          }
+// replace the changed top-level nodes (grid rows, sections...) of the page
+source.addEventListener('patch', function (event) {
+    if (location.search.indexOf('key=') >= 0) {
+        // the patch is made for the page in the original key
+        location.reload();
+        return;
+    }
+    var data = JSON.parse(event.data);
+    var page = document.querySelector('div.page');
+    var footer = null;
+    var nodes = [];
+    for (var i = 0; i < page.children.length; i++) {
+        var child = page.children[i];
+        if (child.classList.contains('footer')) {
+            footer = child;
+        } else if (!child.classList.contains('header')) {
+            nodes.push(child);
+        }
+    }
+    if (nodes.length !== data.count) {
+        // the page is not the one the patch was made for
+        location.reload();
+        return;
+    }
+    // apply the ops from the last one, so that the indexes stay valid
+    for (var k = data.ops.length - 1; k >= 0; k--) {
+        var start = data.ops[k][0], end = data.ops[k][1];
+        var template = document.createElement('template');
+        template.innerHTML = data.ops[k][2];
+        page.insertBefore(template.content, end < nodes.length ? nodes[end] : footer);
+        for (var j = start; j < end; j++) {
+            page.removeChild(nodes[j]);
+        }
+    }
+});
+
+// paginated preview: load the next pages when the end of the page comes into view
+var pager = document.querySelector('div.pager');
+if (pager) {
+    var loading = false;
+    var observer = new IntersectionObserver(function (entries) {
+        if (entries[entries.length - 1].isIntersecting) {
+            loadNextPage();
         }
-        );
-    }, 500)
\ No newline at end of file
+    }, {rootMargin: '1000px'});
+
+    var loadNextPage = function () {
+        var next = parseInt(pager.dataset.next, 10);
+        if (loading || next >= parseInt(pager.dataset.pages, 10)) {
+            return;
+        }
+        loading = true;
+        fetch(server_address + '/page/' + next + '/' + location.search).then(function (response) {
+            if (!response.ok) {
+                throw new Error(response.status);
+            }
+            return response.text();
+        }).then(function (html) {
+            var template = document.createElement('template');
+            template.innerHTML = html;
+            pager.parentNode.insertBefore(template.content, pager);
+            pager.dataset.next = next + 1;
+            loading = false;
+            observer.unobserve(pager);
+            if (next + 1 < parseInt(pager.dataset.pages, 10)) {
+                // observing again checks if the placeholder is still in view
+                observer.observe(pager);
+            } else {
+                pager.remove();
+            }
+        }).catch(function () {
+            // the script was probably modified: start again from the first page
+            location.reload();
+        });
+    };
+
+    observer.observe(pager);
+}
@@ -0,0 +1,267 @@
+"""
+Serialization of a Grid tree to plain Python data (dicts, lists, strings
+and None), that can be stored with json or marshal, and fast loading of a
+Grid from this data.
+
+dumps() and loads() export and import a grid in one of two forms:
+
+    JSON        the data below, as compact JSON text
+    binary      the bytes b"MMDG", the format number (1 byte), then the
+                JSON text (UTF-8) compressed with zlib
+
+A grid is {"format": FORMAT, "info": Grid.info, "tree": [node, ...]},
+where info maps "title", "subtitle", "author" and "copyright" to their
+text or None, and each node of the tree is a list:
+
+    ["row", [block, ...]]       a GridRow, with one block per BarBlock: the
+                                list of its items
+    ["section", [item, ...]]    a Section, whose items are ["name", text],
+                                ["rep", number], "->" and ["note", text]
+    ["vspace", kind]            a Vspace ("" for the default size)
+    ["tag", html]               a raw HTML tag line
+    ["error", text]             a line that was not recognized
+
+The items of a block are its case ["case", text] and its size ["size",
+"short" or "long"] if any, then its barlines "|", "[" and "]", the repeats
+":", the pentagrams "=", the times ["t", divisions, value], the pauses
+["p", number] and the chords ["c", chord, ...], where "" is an empty chord
+and "%" the same-measure sign. The numbers (divisions, repetitions...) are
+kept as the strings of the script. All the texts are the ones of the
+script, that may contain HTML.
+
+The blocks are loaded like the parsed measures (see
+GridProcessor.parse_measure): identical blocks share the same read-only
+BarBlock, rendered once.
+"""
+import json
+import zlib
+from functools import lru_cache
+
+from . import (Grid, GridRow, BarBlock, ChordBlock, Chord, EmptyChord, SameMeasure, Case, Barline,
+               Repeat, Pentagram, Time, Pause, Section, SectionName, SectionRepetitions, Rarrow,
+               SectionComment, Vspace, Element, NotRecognized, GridProcessor, shared_node, emit_bar_block)
+
+# version of the format, to be changed with any incompatible change
+FORMAT = 2
+
+BARLINE_CODES = {kind: code for code, kind in GridProcessor.barline_kind.items()}
+BLOCK_SIZES = {"short", "long"}
+
+
+def dump_item(item):
+    cls = type(item)
+    if cls is ChordBlock:
+        out = ["c"]
+        for chord in item.children:
+            out.append("%" if type(chord) is SameMeasure else chord.html_text)
+        return out
+    if cls is Barline:
+        return BARLINE_CODES[item.kind]
+    if cls is Repeat:
+        return ":"
+    if cls is Pentagram:
+        return "="
+    if cls is Time:
+        return ["t", item.divisions, item.value]
+    if cls is Pause:
+        return ["p", item.number]
+    raise TypeError(f"cannot serialize {cls.__name__} in a bar")
+
+
+def dump_section_item(item):
+    cls = type(item)
+    if cls is SectionName:
+        return ["name", item.html_text]
+    if cls is SectionRepetitions:
+        return ["rep", item.num]
+    if cls is Rarrow:
+        return "->"
+    if cls is SectionComment:
+        return ["note", item.html_text]
+    raise TypeError(f"cannot serialize {cls.__name__} in a section")
+
+
+def dump_block(bb):
+    block = []
+    if bb.case is not None:
+        block.append(["case", bb.case.html_text])
+    if bb.size:
+        block.append(["size", bb.size])
+    block += [dump_item(item) for item in bb.bar.children]
+    return block
+
+
+def dump_node(node):
+    cls = type(node)
+    if cls is GridRow:
+        return ["row", [dump_block(bb) for bb in node.children]]
+    if cls is Section:
+        return ["section", [dump_section_item(item) for item in node.children]]
+    if cls is Vspace:
+        return ["vspace", node.kind]
+    if cls is Element:
+        return ["tag", node.html_text]
+    if cls is NotRecognized:
+        return ["error", node.text]
+    raise TypeError(f"cannot serialize {cls.__name__}")
+
+
+def check_text(value, optional=False):
+    """Return value if it is a string (or None if optional), else raise ValueError."""
+    if type(value) is str or (optional and value is None):
+        return value
+    raise ValueError(f"expected a text, got {value!r}")
+
+
+def dump(g):
+    """
+    Return the serialized form of the grid g.
+    """
+    return {"format": FORMAT, "info": dict(g.info), "tree": [dump_node(node) for node in g.tree]}
+
+
+LEAVES = {code: shared_node(Barline, kind) for code, kind in GridProcessor.barline_kind.items()}
+LEAVES[":"] = shared_node(Repeat)
+LEAVES["="] = shared_node(Pentagram)
+CHORDS = {"": shared_node(EmptyChord), "%": shared_node(SameMeasure)}
+
+
+def load_chord(text):
+    chord = CHORDS.get(text)
+    if chord is None:
+        chord = shared_node(Chord, check_text(text))
+    return chord
+
+
+def block_key(block):
+    """The serialized block as a tuple, the key of load_block."""
+    return tuple([item if type(item) is str else tuple(item) for item in block])
+
+
+@lru_cache(maxsize=4096)
+def load_block(key):
+    """
+    Return the BarBlock of a serialized block, given as a tuple of its items
+    (see block_key). The blocks are interned: the BarBlock must not be
+    modified.
+    """
+    bb = BarBlock()
+    bar = bb.bar
+    for item in key:
+        if type(item) is str:
+            leaf = LEAVES.get(item)
+            if leaf is None:
+                raise ValueError(f"unknown bar item {item!r}")
+            bar.children.append(leaf)
+            continue
+        tag = item[0]
+        if tag == "c":
+            block = ChordBlock()
+            block.children = [load_chord(text) for text in item[1:]]
+            bar.chordBlock = block
+            bar.children.append(block)
+        elif tag == "t" and len(item) == 3:
+            bar.children.append(shared_node(Time, check_text(item[1]), check_text(item[2])))
+        elif tag == "p" and len(item) == 2:
+            bar.children.append(shared_node(Pause, check_text(item[1])))
+        elif tag == "case" and len(item) == 2:
+            bb.case = Case(check_text(item[1]))
+        elif tag == "size" and len(item) == 2 and item[1] in BLOCK_SIZES:
+            bb.size = item[1]
+        else:
+            raise ValueError(f"unknown bar item {list(item)!r}")
+    parts = []
+    emit_bar_block(bb, parts)
+    bb.html = ''.join(parts)
+    return bb
+
+
+def load_section_item(item):
+    if item == "->":
+        return Rarrow()
+    kind, text = item
+    if kind == "name":
+        return SectionName(check_text(text))
+    if kind == "rep":
+        return SectionRepetitions(check_text(text))
+    if kind == "note":
+        return SectionComment(check_text(text))
+    raise ValueError(f"unknown section item {item!r}")
+
+
+def load_node(node):
+    kind = node[0]
+    if kind == "row":
+        row = GridRow()
+        row.children = [load_block(block_key(block)) for block in node[1]]
+        return row
+    if kind == "section":
+        section = Section()
+        section.children = [load_section_item(item) for item in node[1]]
+        return section
+    if kind == "vspace":
+        return Vspace(check_text(node[1]))
+    if kind == "tag":
+        return Element(check_text(node[1]))
+    if kind == "error":
+        return NotRecognized(check_text(node[1]))
+    raise ValueError(f"unknown node {kind!r}")
+
+
+def load(data):
+    """
+    Return the Grid of the serialized form data.
+    Raise ValueError if data is not a serialized grid.
+    """
+    try:
+        return load_grid(data)
+    except (TypeError, KeyError, IndexError, AttributeError) as e:
+        # data of the wrong structure
+        raise ValueError(f"invalid grid: {e!r}") from None
+
+
+def load_grid(data):
+    if data.get("format") != FORMAT:
+        raise ValueError(f"unsupported format {data.get('format')!r} (expected {FORMAT})")
+    g = Grid()
+    info = data["info"]
+    unknown = info.keys() - g.info.keys()
+    if unknown:
+        raise ValueError(f"unknown info fields {sorted(unknown)!r}")
+    for value in info.values():
+        check_text(value, optional=True)
+    g.info.update(info)
+    g.tree = [load_node(node) for node in data["tree"]]
+    return g
+
+
+MAGIC = b"MMDG"
+
+
+def dumps(g, binary=False):
+    """
+    Export the grid g as JSON text, or as bytes if binary is True.
+    """
+    text = json.dumps(dump(g), ensure_ascii=False, separators=(',', ':'))
+    if binary:
+        return MAGIC + bytes([FORMAT]) + zlib.compress(text.encode('utf-8'), 9)
+    return text
+
+
+def loads(data):
+    """
+    Import a grid exported by dumps(), from JSON text or binary bytes.
+    Raise ValueError if data is not an exported grid.
+    """
+    if isinstance(data, (bytes, bytearray)):
+        if data[:len(MAGIC)] == MAGIC:
+            if len(data) <= len(MAGIC) + 1:
+                raise ValueError("truncated grid")
+            if data[len(MAGIC)] != FORMAT:
+                raise ValueError(f"unsupported format {data[len(MAGIC)]} (expected {FORMAT})")
+            try:
+                data = zlib.decompress(data[len(MAGIC) + 1:])
+            except zlib.error as e:
+                raise ValueError(f"corrupted grid: {e}") from None
+        data = data.decode('utf-8')
+    return load(json.loads(data))
@@ -0,0 +1,215 @@
+import json
+from urllib.parse import parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+log = logger.warning
+
+
+class CustomHandler(BaseHTTPRequestHandler):
+    # disable logging
+    # override the logging method of the handler
+
+    watcher = None
+    # seconds between the keep-alive messages of the event stream
+    keep_alive = 15
+    # socket timeout: a slow or stuck client only holds its own thread
+    timeout = 30
+
+    def log_message(self, format, *args):
+        return
+
+    def do_GET(self):
+        path = self.path.split('?', 1)[0]
+        if path == "/events/":
+            self.send_events()
+        elif path == "/stats/":
+            self.send_json(list(self.watcher.stats))
+        elif path in ("/", "/index.html"):
+            self.send_key_page(self.watcher.get_page)
+        elif self.page_index(path) is not None:
+            index = self.page_index(path)
+            self.send_key_page(lambda key: self.watcher.get_page(key, index))
+        else:
+            self.send_error(404)
+
+    def do_HEAD(self):
+        path = self.path.split('?', 1)[0]
+        if path in ("/", "/index.html"):
+            self.send_key_page(self.watcher.get_page, head=True)
+        elif self.page_index(path) is not None:
+            index = self.page_index(path)
+            self.send_key_page(lambda key: self.watcher.get_page(key, index), head=True)
+        else:
+            self.send_error(404)
+
+    @staticmethod
+    def page_index(path):
+        """The N of a /page/N path of a paginated preview, or None."""
+        parts = path.strip('/').split('/')
+        if len(parts) == 2 and parts[0] == "page" and parts[1].isdigit():
+            return int(parts[1])
+        return None
+
+    def query_param(self, name):
+        """The value of the query parameter name, or None."""
+        query = parse_qs(self.path.split('?', 1)[1]) if '?' in self.path else {}
+        return query.get(name, [None])[-1]
+
+    def query_key(self):
+        """The key of the ?key= query parameter, or None."""
+        return self.query_param('key')
+
+    def client_version(self, current):
+        """
+        The version of the page of the client of an event stream: the
+        Last-Event-ID of a reconnection, else the ?since= query parameter
+        (the version written in the page), else the current version.
+        """
+        for since in (self.headers.get('Last-Event-ID'), self.query_param('since')):
+            if since and since.isdigit():
+                return int(since)
+        return current
+
+    def send_key_page(self, get_page, head=False):
+        """
+        Send the page get_page(key), where key is the ?key= query parameter
+        that transposes the chords.
+        """
+        try:
+            page = get_page(self.query_key())
+        except ValueError as e:
+            self.send_error(400, str(e))
+            return
+        except IndexError as e:
+            self.send_error(404, str(e))
+            return
+        self.send_page(page, head=head)
+
+    def send_json(self, data):
+        body = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_page(self, page, head=False):
+        """
+        Send a compiled page, gzip-compressed if the client accepts it.
+        Answer 304 if the client already has it (same ETag).
+        """
+        if page is None:
+            self.send_error(503, "The script is not compiled yet")
+            return
+
+        if_none_match = self.headers.get('If-None-Match', '')
+        if page.etag in [tag.strip() for tag in if_none_match.split(',')]:
+            self.send_response(304)
+            self.send_header('ETag', page.etag)
+            self.end_headers()
+            return
+
+        body = page.body
+        gzipped = 'gzip' in self.headers.get('Accept-Encoding', '')
+        if gzipped:
+            body = page.gzip_body
+        self.send_response(200)
+        self.send_header('Content-type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', page.etag)
+        # the client must check that the page did not change before using its copy
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Vary', 'Accept-Encoding')
+        if gzipped:
+            self.send_header('Content-Encoding', 'gzip')
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+
+    def send_events(self):
+        """
+        Server-Sent Events stream: after each recompilation of the script,
+        send the client a "patch" event with the changed nodes of the page
+        or, if the page cannot be patched, a "reload" message.
+
+        The stream starts from the version of the page of the client (see
+        client_version): if the script was recompiled since, the client is
+        notified at once.
+        """
+        self.stream_events(self.client_version(self.watcher.version), self.next_event)
+
+    def next_event(self, version):
+        """
+        Wait for the recompilation after version, at most self.keep_alive
+        seconds. Return the new version and the message to send (or None).
+        """
+        new_version = self.watcher.wait_change(version, timeout=self.keep_alive)
+        if new_version == version:
+            return version, None
+        patch = self.watcher.patch
+        if patch and patch[:2] == (version, new_version):
+            # the client has the previous version: send the changed nodes only
+            return new_version, f'id: {new_version}\nevent: patch\ndata: {patch[2]}\n\n'
+        return new_version, f'id: {new_version}\ndata: reload\n\n'
+
+    def stream_events(self, version, next_event):
+        """
+        Send a Server-Sent Events stream, with the messages returned by
+        next_event(version) -> (version, message).
+        """
+        self.send_response(200)
+        self.send_header('Content-type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        try:
+            while True:
+                version, message = next_event(version)
+                if message:
+                    self.wfile.write(message.encode())
+                else:
+                    # a comment line, to detect the disconnected clients
+                    self.wfile.write(b': keep-alive\n\n')
+                self.wfile.flush()
+        except OSError:
+            # disconnected or stuck client
+            return
+
+
+class PreviewServer(ThreadingHTTPServer):
+    """
+    HTTP server that handles each connection in its own daemon thread.
+    """
+    daemon_threads = True
+    # queue the connections of many clients that connect at the same time
+    request_queue_size = 128
+
+
+class ThreadedServer(threading.Thread):
+    def __init__(self, watcher, port=8000, handler=CustomHandler):
+        self.httpd = None
+        self.port = port
+        handler.watcher = watcher
+        watcher.in_memory = True
+        self.handler = handler
+
+        while self.httpd is None:
+            try:
+                self.httpd = PreviewServer(('localhost', self.port), self.handler)
+                super().__init__()
+            except OSError:
+                self.port += 1
+
+    def run(self):
+        log("Server running.\n" \
+            f"Open this address (http://localhost:{self.port}) in a web browser to see your grid")
+        self.httpd.serve_forever()
+        self.handler
+        log("Server terminated")
+
+    def stop_server(self):
+        self.httpd.shutdown()
+        self.httpd.socket.close()
@@ -0,0 +1,227 @@
+import os
+import html
+import threading
+from fnmatch import fnmatch
+from collections import OrderedDict, deque
+from urllib.parse import quote, unquote
+
+from . import GridProcessor, Page, CompileProfile, load_resource, page_head, measure_cache_stats, render_page
+from .server import CustomHandler
+
+
+class Songbook(threading.Thread):
+    """
+    A directory of scripts previewed by the live server.
+
+    The scripts are compiled on demand, and their Grid and Page are kept in
+    a LRU cache of cache_size entries, validated by the modification time
+    of the script and its version (see notify_change). The thread watches the directory: it invalidates the
+    entries of the modified scripts and notifies their preview clients.
+    """
+    def __init__(self, directory, cache_size=32, pattern="*.txt", debounce=0.1):
+        self.directory = directory
+        self.cache_size = cache_size
+        self.pattern = pattern
+        self.debounce = debounce
+        self.stop = False
+        self.live_server_addr = None
+        # split the previews in pages of page_rows grid rows (see render_page)
+        self.page_rows = None
+        # script name -> (mtime, version, Grid, Page, {((semitones, flats) or None,
+        # page index or None): Page}), from the least recently used
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        # CompileProfile.to_dict() of the last compilations
+        self.stats = deque(maxlen=20)
+        # script name -> number of modifications, waited for with self.changed
+        self.versions = {}
+        self.changed = threading.Condition()
+        super(Songbook, self).__init__()
+
+    def tunes(self):
+        return sorted(e.name for e in os.scandir(self.directory)
+                      if e.is_file() and fnmatch(e.name, self.pattern))
+
+    def is_tune(self, name):
+        return os.path.basename(name) == name and fnmatch(name, self.pattern) \
+            and os.path.isfile(os.path.join(self.directory, name))
+
+    def get_page(self, name, key=None, index=None):
+        """
+        Return the compiled page of the script name (compiled if needed),
+        with the chords transposed to key if given, or None if there is no
+        such script. Raise ValueError for an invalid key.
+
+        If self.page_rows is set, the previews are paginated: return the
+        first page, or the nodes of the page index (see render_page).
+        """
+        if index is not None and not self.page_rows:
+            raise IndexError("the preview is not paginated")
+        if not self.is_tune(name):
+            return None
+        path = os.path.join(self.directory, name)
+        # read before the script: a page is never newer than its version
+        version = self.versions.get(name, 0)
+        mtime = os.stat(path).st_mtime
+        with self.lock:
+            entry = self.cache.get(name)
+            if entry is not None and entry[:2] == (mtime, version):
+                self.cache.move_to_end(name)
+                self.hits += 1
+                if not key and not self.page_rows:
+                    return entry[3]
+            else:
+                self.misses += 1
+                entry = None
+
+        if entry is None:
+            # compile outside of the lock, not to block the requests of other tunes
+            entry = self.compile(name, path, mtime, version)
+        if not key and not self.page_rows:
+            return entry[3]
+
+        _, version, g, _, pages = entry
+        transposition = None
+        if key:
+            from .transpose import resolve_key
+            transposition = resolve_key(g, key)
+        page = pages.get((transposition, index))
+        if page is None:
+            if transposition:
+                from .transpose import transpose_grid
+                g = transpose_grid(g, *transposition)
+            if self.page_rows:
+                html = render_page(g, self.page_rows, index, live_server_addr=self.tune_address(name),
+                                   version=version)
+            else:
+                html = g.to_html(live_server_addr=self.tune_address(name), version=version)
+            page = pages[(transposition, index)] = Page(html)
+        return page
+
+    def tune_address(self, name):
+        return f'{self.live_server_addr}/tunes/{quote(name)}'
+
+    def compile(self, name, path, mtime, version):
+        """
+        Compile the script name, at the given version (see notify_change),
+        and store its cache entry, returned.
+        """
+        profile = CompileProfile()
+        with profile.stage("read"):
+            with open(path, "r", encoding='utf-8') as f:
+                lines = f.readlines()
+        with profile.stage("parse"):
+            g = GridProcessor().run(lines)
+        with profile.stage("render"):
+            html = g.to_html(live_server_addr=self.tune_address(name), version=version)
+        with profile.stage("page"):
+            page = Page(html)
+        profile.counts["lines"] = len(lines)
+        profile.counts["nodes"] = len(g.tree)
+        self.stats.append(dict(profile.to_dict(), tune=name))
+
+        entry = (mtime, version, g, page, {})
+        with self.lock:
+            self.cache[name] = entry
+            self.cache.move_to_end(name)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return entry
+
+    def index_page(self):
+        links = [f'<li><a href="/tunes/{quote(name)}/">{html.escape(name)}</a></li>' for name in self.tunes()]
+        return Page(page_head(load_resource("musicgrid.css")) +
+                    '<div class="page">'
+                    f'<div class="header"><h1>{html.escape(os.path.basename(os.path.abspath(self.directory)))}</h1></div>\n'
+                    '<ul class="songbook">\n' + '\n'.join(links) + '\n</ul>'
+                    '</div>\n</body>\n</html>')
+
+    def notify_change(self, names):
+        with self.lock:
+            for name in names:
+                self.cache.pop(name, None)
+        with self.changed:
+            for name in names:
+                self.versions[name] = self.versions.get(name, 0) + 1
+            self.changed.notify_all()
+
+    def wait_change(self, name, version, timeout=None):
+        """
+        Wait for a modification of the script name after the given version,
+        at most timeout seconds. Return the current version.
+        """
+        with self.changed:
+            self.changed.wait_for(lambda: self.versions.get(name, 0) != version, timeout)
+            return self.versions.get(name, 0)
+
+    def run(self):
+        from .filewatch import open_watch
+
+        watch = open_watch(self.directory)
+        try:
+            while not self.stop:
+                if watch.wait(timeout=0.5):
+                    while watch.wait(timeout=self.debounce):
+                        pass
+                    self.notify_change(watch.pop_changed())
+        finally:
+            watch.close()
+
+
+class SongbookHandler(CustomHandler):
+    """
+    Routes: / the index of the tunes, /tunes/<name>/ the preview of a tune,
+    /tunes/<name>/page/<N> the page N of a paginated preview,
+    /tunes/<name>/events/ its reload events, /stats/ the statistics of the
+    cache and of the interned measures, and the timings of the last
+    compilations.
+    """
+    def do_GET(self):
+        self.handle_path(head=False)
+
+    def do_HEAD(self):
+        self.handle_path(head=True)
+
+    def handle_path(self, head):
+        path = unquote(self.path.split('?', 1)[0])
+        if path in ("/", "/index.html"):
+            self.send_page(self.watcher.index_page(), head=head)
+            return
+        if path == "/stats/" and not head:
+            songbook = self.watcher
+            self.send_json({"cache": {"size": len(songbook.cache), "max_size": songbook.cache_size,
+                                      "hits": songbook.hits, "misses": songbook.misses},
+                            "measures": measure_cache_stats(),
+                            "compilations": list(songbook.stats)})
+            return
+        parts = path.split('/')  # '', 'tunes', name, ['events' or 'page', N], ''
+        if len(parts) < 4 or parts[1] != "tunes" or parts[-1] != '':
+            self.send_error(404)
+            return
+        name = parts[2]
+        if parts[3:] == ['']:
+            if self.watcher.is_tune(name):
+                self.send_key_page(lambda key: self.watcher.get_page(name, key), head=head)
+            else:
+                self.send_error(404)
+        elif len(parts) == 6 and parts[3] == 'page' and parts[4].isdigit() and self.watcher.is_tune(name):
+            index = int(parts[4])
+            self.send_key_page(lambda key: self.watcher.get_page(name, key, index), head=head)
+        elif parts[3:] == ['events', ''] and not head and self.watcher.is_tune(name):
+            self.send_tune_events(name)
+        else:
+            self.send_error(404)
+
+    def send_tune_events(self, name):
+        songbook = self.watcher
+
+        def next_event(version):
+            new_version = songbook.wait_change(name, version, timeout=self.keep_alive)
+            if new_version == version:
+                return version, None
+            return new_version, f'id: {new_version}\ndata: reload\n\n'
+
+        # the stream starts from the version of the page of the client
+        self.stream_events(self.client_version(songbook.versions.get(name, 0)), next_event)
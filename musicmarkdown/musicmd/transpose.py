@@ -0,0 +1,170 @@
+"""
+Transposition of the chords of a grid.
+
+A key is given either as a number of semitones ("+2", "-3", "5") or as the
+name of the key to transpose to ("D", "Bb", "F#m"). With a key name, the
+key of the tune is the root of its last chord, where tunes usually end.
+
+The spelling of the transposed chords (sharps or flats) follows the new
+key: e.g. "Bb7" in F, "A#7" in B.
+
+A chord symbol is a root note, a quality made of the usual chord suffixes
+(m, maj7, dim, sus4, add9, 7b9, 6/9, (#11)...) and an optional bass note
+after a slash ("D/F#"). The other texts of the bars (e.g. "Fine", "Coda")
+are not transposed.
+"""
+import re
+from functools import lru_cache
+
+from . import Grid, GridRow, BarBlock, ChordBlock, Chord, shared_node
+
+NOTE_INDEX = {'C': 0, 'D': 2, 'E': 4, 'F': 5, 'G': 7, 'A': 9, 'B': 11}
+SHARP_NAMES = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
+FLAT_NAMES = ['C', 'Db', 'D', 'Eb', 'E', 'F', 'Gb', 'G', 'Ab', 'A', 'Bb', 'B']
+# the major keys written with flats (F, Bb, Eb, Ab, Db, Gb)
+FLAT_KEYS = {5, 10, 3, 8, 1, 6}
+
+# an alteration or extension: 7, b9, #11, +5, and 6/9 or 7/9
+TENSION = r'[#b+-]?\d+|/\d+'
+SUFFIX = rf'maj|min|dim|aug|sus|add|omit|alt|no|m|M|o|°|ø|\+|-|{TENSION}|\((?:{TENSION}|maj|add|sus|omit|no|,)+\)'
+CHORD = re.compile(rf'([A-G])([#b]?)((?:{SUFFIX})*)(?:/([A-G])([#b]?))?')
+KEY = re.compile(r'([A-G])([#b]?)(m?)')
+SHIFT = re.compile(r'[+-]?\d+')
+
+
+def note_index(letter, accidental):
+    return (NOTE_INDEX[letter] + {'#': 1, 'b': -1}.get(accidental, 0)) % 12
+
+
+def uses_flats(tonic, minor=False):
+    """Whether the key of tonic (a note index) is written with flats."""
+    if minor:
+        tonic = (tonic + 3) % 12  # relative major
+    return tonic in FLAT_KEYS
+
+
+@lru_cache(maxsize=1024)
+def parse_chord(text):
+    """
+    Return the (root, quality, bass) of a chord symbol, with root and bass
+    as note indexes (bass None without a slash), or None if text is not a
+    chord symbol.
+    """
+    m = CHORD.fullmatch(text)
+    if m is None:
+        return None
+    root = note_index(m.group(1), m.group(2))
+    bass = note_index(m.group(4), m.group(5)) if m.group(4) else None
+    return root, m.group(3), bass
+
+
+@lru_cache(maxsize=None)
+def note_table(semitones, flats):
+    """The names of the 12 notes transposed by semitones, by note index."""
+    names = FLAT_NAMES if flats else SHARP_NAMES
+    return tuple(names[(i + semitones) % 12] for i in range(12))
+
+
+@lru_cache(maxsize=4096)
+def transpose_chord(text, semitones, flats):
+    """
+    Return the chord symbol text transposed by semitones, written with
+    flats or sharps. Texts that are not chord symbols are kept as they are.
+    """
+    parsed = parse_chord(text)
+    if parsed is None:
+        return text
+    root, quality, bass = parsed
+    table = note_table(semitones, flats)
+    out = table[root] + quality
+    if bass is not None:
+        out += '/' + table[bass]
+    return out
+
+
+def tune_key(g):
+    """
+    Return the key of the grid g, as (tonic note index, minor), from its
+    last chord, or None if it has no chord.
+    """
+    for node in reversed(g.tree):
+        if type(node) is not GridRow:
+            continue
+        for bb in reversed(node.children):
+            for item in reversed(bb.bar.children):
+                if type(item) is not ChordBlock:
+                    continue
+                for chord in reversed(item.children):
+                    if type(chord) is Chord:
+                        parsed = parse_chord(chord.html_text)
+                        if parsed is not None:
+                            root, quality, _ = parsed
+                            return root, quality.startswith('m') and not quality.startswith('maj')
+    return None
+
+
+def resolve_key(g, key):
+    """
+    Return the (semitones, flats) transposition of the grid g to the key
+    (see the module documentation). Raise ValueError for an invalid key.
+    """
+    key = key.strip()
+    current = tune_key(g)
+    if SHIFT.fullmatch(key):
+        semitones = int(key) % 12
+        if current is None:
+            return semitones, False
+        tonic, minor = current
+        return semitones, uses_flats((tonic + semitones) % 12, minor)
+    m = KEY.fullmatch(key)
+    if m is None:
+        raise ValueError(f"invalid key {key!r}")
+    tonic = note_index(m.group(1), m.group(2))
+    if m.group(2):
+        flats = m.group(2) == 'b'
+    else:
+        flats = uses_flats(tonic, bool(m.group(3)))
+    if current is None:
+        return 0, flats
+    return (tonic - current[0]) % 12, flats
+
+
+def transpose_node(node, semitones, flats):
+    """
+    Return the top-level node transposed: a new grid row if node is a grid
+    row, else node itself (the other nodes do not contain chords).
+    """
+    if type(node) is not GridRow:
+        return node
+    row = GridRow()
+    for bb in node.children:
+        new_bb = BarBlock(bb.size)
+        new_bb.case = bb.case
+        bar = new_bb.bar
+        for item in bb.bar.children:
+            if type(item) is ChordBlock:
+                block = ChordBlock()
+                block.children = [shared_node(Chord, transpose_chord(chord.html_text, semitones, flats))
+                                  if type(chord) is Chord else chord
+                                  for chord in item.children]
+                bar.chordBlock = block
+                item = block
+            bar.children.append(item)
+        row.children.append(new_bb)
+    return row
+
+
+def transpose(g, key):
+    """
+    Return a new Grid with the chords of g transposed to key (see
+    resolve_key). The nodes without chords are shared with g.
+    """
+    semitones, flats = resolve_key(g, key)
+    return transpose_grid(g, semitones, flats)
+
+
+def transpose_grid(g, semitones, flats):
+    new = Grid()
+    new.info.update(g.info)
+    new.tree = [transpose_node(node, semitones, flats) for node in g.tree]
+    return new
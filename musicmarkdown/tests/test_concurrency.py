@@ -0,0 +1,59 @@
+"""
+Concurrency test of the reentrant compile API: many distinct scripts
+compiled at the same time in a thread pool give the outputs of a
+sequential compilation, each with the header of its own script.
+
+A larger run is benchmarks/stress_compile.py.
+
+    python -m pytest tests
+"""
+import os
+import sys
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+
+import musicmd  # noqa: E402
+from stress_compile import make_script, check_header  # noqa: E402
+
+SCRIPTS = 50
+ROWS = 30
+THREADS = 8
+ROUNDS = 3
+
+
+class TestConcurrency(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.scripts = [make_script(seed, ROWS) for seed in range(SCRIPTS)]
+        cls.jobs = [seed for _ in range(ROUNDS) for seed in range(SCRIPTS)]
+
+    def run_jobs(self, fn):
+        with ThreadPoolExecutor(max_workers=THREADS) as pool:
+            return list(pool.map(fn, self.jobs))
+
+    def test_compile_string(self):
+        expected = [musicmd.compile_string(script) for script in self.scripts]
+        outputs = self.run_jobs(lambda seed: musicmd.compile_string(self.scripts[seed]))
+        for seed, html in zip(self.jobs, outputs):
+            self.assertEqual(check_header(seed, html), [], f'script {seed}')
+            self.assertEqual(html, expected[seed], f'script {seed}')
+
+    def test_compile_string_transposed(self):
+        keys = ['+2', 'Bb', '-5']
+        expected = [musicmd.compile_string(script, key=keys[seed % 3]) for seed, script in enumerate(self.scripts)]
+        outputs = self.run_jobs(lambda seed: musicmd.compile_string(self.scripts[seed], key=keys[seed % 3]))
+        for seed, html in zip(self.jobs, outputs):
+            self.assertEqual(html, expected[seed], f'script {seed}')
+
+    def test_parse(self):
+        expected = [repr(musicmd.parse(script)) for script in self.scripts]
+        outputs = self.run_jobs(lambda seed: repr(musicmd.parse(self.scripts[seed])))
+        for seed, tree in zip(self.jobs, outputs):
+            self.assertEqual(tree, expected[seed], f'script {seed}')
+
+
+if __name__ == '__main__':
+    unittest.main()
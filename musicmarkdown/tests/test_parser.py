@@ -0,0 +1,71 @@
+"""
+Regression tests of the parser: the parsed trees and the HTML pages of the
+scripts in tests/golden must be identical to those of the original parser.
+
+The golden files are the script.txt example and scripts generated with
+benchmarks/generate.py (--rows 40 --seed 1, 2 and 3). The .repr and .html
+files were produced by the original parser, with a fresh GridProcessor
+for each script.
+
+    python -m pytest tests
+"""
+import glob
+import os
+import unittest
+
+from musicmd import GridProcessor, compile_string
+
+GOLDEN = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'golden')
+
+
+def read(filename):
+    with open(filename, encoding='utf-8') as f:
+        return f.read()
+
+
+def golden_scripts():
+    """The (script filename, golden filename without extension) pairs."""
+    return [(filename, filename[:-len('.txt')]) for filename in sorted(glob.glob(os.path.join(GOLDEN, '*.txt')))]
+
+
+class TestGolden(unittest.TestCase):
+
+    def test_scripts(self):
+        self.assertTrue(golden_scripts())
+
+    def test_tree(self):
+        for script, golden in golden_scripts():
+            with self.subTest(script=os.path.basename(script)):
+                with open(script, encoding='utf-8') as f:
+                    g = GridProcessor().run(f.readlines())
+                self.assertEqual(repr(g), read(golden + '.repr'))
+
+    def test_html(self):
+        for script, golden in golden_scripts():
+            with self.subTest(script=os.path.basename(script)):
+                with open(script, encoding='utf-8') as f:
+                    g = GridProcessor().run(f.readlines())
+                self.assertEqual(g.to_html(), read(golden + '.html'))
+
+    def test_compile_string(self):
+        for script, golden in golden_scripts():
+            with self.subTest(script=os.path.basename(script)):
+                self.assertEqual(compile_string(read(script)), read(golden + '.html'))
+
+    def test_rows(self):
+        # each grid row parsed alone gives the row of the tree
+        for script, golden in golden_scripts():
+            with self.subTest(script=os.path.basename(script)):
+                rows = [line for line in read(golden + '.repr').splitlines() if line.startswith('Row(')]
+                gp = GridProcessor()
+                parsed = []
+                for line in read(script).splitlines():
+                    line = gp.strip_comment(line).strip()
+                    kind, m = gp.classify_line(line) if line else (None, None)
+                    if kind == "grid-row":
+                        parsed.append('Row(' + ', '.join(repr(bb) for bb in gp.parse_row(m.group(0))) + ')')
+                self.assertEqual(parsed, rows)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+"""
+Tests of the patches of the live preview (Watcher.make_patch): applied to
+the nodes of the previous page, they give the nodes of the new one, and
+they are computed quickly on long repetitive scripts.
+
+    python -m pytest tests
+"""
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from musicmd import Watcher
+
+ROWS = ['| G | % | % | % |\n', '| C | % | % | % |\n']
+
+
+def apply_patch(tree_html, patch):
+    """The HTML of the nodes of the page tree_html once patched."""
+    nodes = list(tree_html)
+    data = json.loads(patch)
+    assert data["count"] == len(nodes)
+    for start, end, html in reversed(data["ops"]):
+        nodes[start:end] = [html] if html else []
+    return '\n'.join(nodes)
+
+
+class TestPatch(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'script.txt')
+        self.watcher = Watcher(self.filename, out_filename=None)
+        self.watcher.in_memory = True
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def compile(self, lines):
+        with open(self.filename, 'w', encoding='utf-8') as f:
+            f.writelines(lines)
+        old_html = self.watcher.tree_html
+        self.watcher.compile()
+        version, patch = self.watcher.version, self.watcher.patch
+        if patch is None:
+            return old_html, None
+        self.assertEqual(patch[:2], (version - 1, version))
+        return old_html, patch[2]
+
+    def check(self, old_lines, new_lines):
+        self.compile(old_lines)
+        old_html, patch = self.compile(new_lines)
+        self.assertIsNotNone(patch)
+        self.assertEqual(apply_patch(old_html, patch), '\n'.join(self.watcher.tree_html))
+        return patch
+
+    def test_edits(self):
+        lines = ['# Tune\n', '- [A]\n'] + ROWS * 20 + ['- [B]\n'] + ROWS * 20
+        self.check(lines, lines[:10] + ['| D | E |\n'] + lines[11:])
+        self.check(lines, lines[:10] + ['| D | E |\n'] + lines[10:])
+        self.check(lines, lines[:10] + lines[11:])
+        self.check(lines, lines[:3] + ['| F |\n'] + lines[3:40] + ['%vspace%\n'] + lines[40:])
+        self.check(lines, lines[:-1])
+        self.check(lines, lines + ['| F |\n'])
+
+    def test_header_change(self):
+        self.compile(['# Tune\n', '| C |\n'])
+        self.assertIsNone(self.compile(['# Other tune\n', '| C |\n'])[1])
+
+    def test_large_change(self):
+        lines = ROWS * 1000
+        self.compile(lines)
+        changed = ['| D |\n' if i % 3 == 0 else line for i, line in enumerate(lines)]
+        self.assertIsNone(self.compile(changed)[1])
+
+    def test_repetitive_script(self):
+        # the comparison of all the nodes took seconds on 10k repeated rows
+        lines = ROWS * 5000
+        changed = list(lines)
+        changed[5000] = '| D | % | % | % |\n'
+        patch = self.check(lines, changed)
+        self.assertEqual(len(json.loads(patch)["ops"]), 1)
+        self.assertLess(self.watcher.stats[-1]["stages"]["patch"], 0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+"""
+Tests of the export and import of the grids (musicmd.serialize): the JSON
+and binary forms of the scripts in tests/golden load back to the same
+grid, and invalid data raises ValueError.
+
+    python -m pytest tests
+"""
+import glob
+import os
+import unittest
+
+from musicmd import parse
+from musicmd.serialize import dumps, loads, MAGIC, FORMAT
+
+GOLDEN = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'golden')
+
+
+def golden_grids():
+    """The (script name, Grid) of the scripts of tests/golden."""
+    grids = []
+    for filename in sorted(glob.glob(os.path.join(GOLDEN, '*.txt'))):
+        with open(filename, encoding='utf-8') as f:
+            grids.append((os.path.basename(filename), parse(f.read())))
+    return grids
+
+
+class TestRoundTrip(unittest.TestCase):
+
+    def check_round_trip(self, binary):
+        for name, g in golden_grids():
+            with self.subTest(script=name):
+                data = dumps(g, binary=binary)
+                loaded = loads(data)
+                self.assertEqual(repr(loaded), repr(g))
+                self.assertEqual(loaded.to_html(), g.to_html())
+                self.assertEqual(dumps(loaded, binary=binary), data)
+
+    def test_json(self):
+        self.check_round_trip(binary=False)
+
+    def test_binary(self):
+        self.check_round_trip(binary=True)
+
+    def test_interned_blocks(self):
+        g = loads(dumps(parse('| C | G7 |\n| C | % |\n')))
+        first, second = g.tree
+        self.assertIs(first.children[0], second.children[0])
+        self.assertIsNotNone(first.children[1].html)
+
+    def test_binary_header(self):
+        data = dumps(parse('# A\n| C |\n'), binary=True)
+        self.assertEqual(data[:len(MAGIC)], MAGIC)
+        self.assertEqual(data[len(MAGIC)], FORMAT)
+
+
+def exported(tree, info='{}', format=FORMAT):
+    """The JSON text of an exported grid."""
+    return f'{{"format": {format}, "info": {info}, "tree": {tree}}}'
+
+
+def exported_row(block):
+    return exported(f'[["row", [{block}]]]')
+
+
+class TestInvalid(unittest.TestCase):
+
+    def assertInvalid(self, data):
+        with self.assertRaises(ValueError):
+            loads(data)
+
+    def test_exported(self):
+        loads(exported('[]'))
+        loads(exported_row('["|", ["case", "1."], ["size", "short"], ["c", "G7", "", "%"], ["t", "3", "4"], ["p", "4"]]'))
+
+    def test_binary(self):
+        self.assertInvalid(MAGIC)
+        self.assertInvalid(MAGIC + bytes([FORMAT]))
+        self.assertInvalid(MAGIC + bytes([FORMAT + 1]) + b'x')
+        self.assertInvalid(MAGIC + bytes([FORMAT]) + b'not zlib')
+        self.assertInvalid(b'\xff')
+
+    def test_structure(self):
+        self.assertInvalid('')
+        self.assertInvalid('[]')
+        self.assertInvalid(f'{{"format": {FORMAT}}}')
+        self.assertInvalid(exported('[]', format=FORMAT + 1))
+        self.assertInvalid(exported('[]', info='[]'))
+        self.assertInvalid(exported('[["unknown"]]'))
+        self.assertInvalid(exported_row('5'))
+        self.assertInvalid(exported_row('[5]'))
+        self.assertInvalid(exported_row('[{}]'))
+
+    def test_info(self):
+        self.assertInvalid(exported('[]', info='{"x": 1}'))
+        self.assertInvalid(exported('[]', info='{"title": 1}'))
+
+    def test_texts(self):
+        self.assertInvalid(exported_row('[["c", 5]]'))
+        self.assertInvalid(exported_row('[["case", 3]]'))
+        self.assertInvalid(exported_row('[["size", "huge"]]'))
+        self.assertInvalid(exported_row('[["size", ""]]'))
+        self.assertInvalid(exported_row('[["t", 4, 4]]'))
+        self.assertInvalid(exported_row('[["p"]]'))
+        self.assertInvalid(exported_row('["x"]'))
+        self.assertInvalid(exported('[["section", [["name", {}]]]]'))
+        self.assertInvalid(exported('[["vspace", []]]'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+"""
+Tests of the transposition of the chords (musicmd.transpose).
+
+    python -m pytest tests
+"""
+import unittest
+
+from musicmd import parse, compile_string, GridRow, ChordBlock, Chord
+from musicmd.transpose import parse_chord, transpose_chord, tune_key, resolve_key, transpose
+
+
+def chords(g):
+    """The chord symbols of the grid g, in order."""
+    return [chord.html_text
+            for node in g.tree if type(node) is GridRow
+            for bb in node.children
+            for item in bb.bar.children if type(item) is ChordBlock
+            for chord in item.children if type(chord) is Chord]
+
+
+def transposed(script, key):
+    return chords(transpose(parse(script), key))
+
+
+class TestChords(unittest.TestCase):
+
+    def test_parse(self):
+        self.assertEqual(parse_chord('C'), (0, '', None))
+        self.assertEqual(parse_chord('F#m7b5'), (6, 'm7b5', None))
+        self.assertEqual(parse_chord('Ebmaj7'), (3, 'maj7', None))
+        self.assertEqual(parse_chord('D/F#'), (2, '', 6))
+        self.assertEqual(parse_chord('Am7/G'), (9, 'm7', 7))
+
+    def test_qualities(self):
+        for text in ['Am', 'Ab6', 'Db7#9', 'Bbm6', 'G7/9', 'C6/9', 'Csus4', 'Cadd9', 'C7(b9)', 'C7(b9,#11)',
+                     'Caug', 'C+', 'Cdim7', 'C°7', 'Cø7', 'CM7', 'Cmaj7#11', 'Gm(maj7)', 'C-7', 'E7alt']:
+            with self.subTest(chord=text):
+                self.assertIsNotNone(parse_chord(text))
+
+    def test_not_chords(self):
+        for text in ['Fine', 'Coda', 'Drums', 'Bass', 'Abc', 'Bbb', 'Gm7/', 'C/H', 'a.b', '"x"', '(Break!)', '1.']:
+            with self.subTest(text=text):
+                self.assertIsNone(parse_chord(text))
+                self.assertEqual(transpose_chord(text, 2, False), text)
+
+    def test_sharps_and_flats(self):
+        self.assertEqual(transpose_chord('Bb7', 0, False), 'A#7')
+        self.assertEqual(transpose_chord('A#7', 0, True), 'Bb7')
+        self.assertEqual(transpose_chord('C', 1, False), 'C#')
+        self.assertEqual(transpose_chord('C', 1, True), 'Db')
+
+    def test_slash_chords(self):
+        self.assertEqual(transpose_chord('D/F#', 2, False), 'E/G#')
+        self.assertEqual(transpose_chord('C/E', 3, True), 'Eb/G')
+        # 7/9 is a quality, not a bass note
+        self.assertEqual(transpose_chord('G7/9', 2, False), 'A7/9')
+
+
+class TestKeys(unittest.TestCase):
+
+    def test_tune_key(self):
+        self.assertEqual(tune_key(parse('| C | F | G7 | C |\n')), (0, False))
+        self.assertEqual(tune_key(parse('| Am | Dm | E7 | Am |\n')), (9, True))
+        self.assertEqual(tune_key(parse('| C | Cmaj7 |\n')), (0, False))
+        # the words of the last bar are not chords
+        self.assertEqual(tune_key(parse('| G7 | C | Fine |\n')), (0, False))
+        self.assertIsNone(tune_key(parse('| -4- | === |\n')))
+
+    def test_semitones(self):
+        g = parse('| C | F | G7 | C |\n')
+        self.assertEqual(resolve_key(g, '+2'), (2, False))
+        self.assertEqual(resolve_key(g, '-2'), (10, True))
+        self.assertEqual(resolve_key(g, '5'), (5, True))
+        self.assertEqual(transposed('| C | F | G7 | C |\n', '-3'), ['A', 'D', 'E7', 'A'])
+
+    def test_key_names(self):
+        script = '| C | F | G7 | C |\n'
+        self.assertEqual(transposed(script, 'D'), ['D', 'G', 'A7', 'D'])
+        self.assertEqual(transposed(script, 'Bb'), ['Bb', 'Eb', 'F7', 'Bb'])
+        self.assertEqual(transposed(script, 'B'), ['B', 'E', 'F#7', 'B'])
+        self.assertEqual(transposed(script, 'Db'), ['Db', 'Gb', 'Ab7', 'Db'])
+        self.assertEqual(transposed(script, 'C#'), ['C#', 'F#', 'G#7', 'C#'])
+
+    def test_minor_keys(self):
+        script = '| Am | Dm | E7 | Am |\n'
+        self.assertEqual(transposed(script, 'Dm'), ['Dm', 'Gm', 'A7', 'Dm'])
+        self.assertEqual(transposed(script, 'Em'), ['Em', 'Am', 'B7', 'Em'])
+        self.assertEqual(transposed(script, 'Cm'), ['Cm', 'Fm', 'G7', 'Cm'])
+
+    def test_invalid_key(self):
+        g = parse('| C |\n')
+        for key in ['Q', 'H', 'C##', '+x', '']:
+            with self.subTest(key=key):
+                with self.assertRaises(ValueError):
+                    resolve_key(g, key)
+
+
+class TestTranspose(unittest.TestCase):
+
+    def test_words(self):
+        html = compile_string('| Fine | Coda | Drums | Bass solo |\n| C |\n', key='+2')
+        for word in ['Fine', 'Coda', 'Drums', 'Bass', 'solo']:
+            self.assertIn(f'>{word}<', html)
+        self.assertIn('>D<', html)
+
+    def test_grid(self):
+        script = '# Tune\n- [A]\n| {1.} C/E | % | -4- | === |\n%vspace%\n| D7 :] F |\n'
+        g = parse(script)
+        t = transpose(g, '+2')
+        self.assertEqual(chords(t), ['D/F#', 'E7', 'G'])
+        self.assertEqual(t.info, g.info)
+        self.assertEqual(len(t.tree), len(g.tree))
+        # the grid itself is not modified
+        self.assertEqual(chords(g), ['C/E', 'D7', 'F'])
+        self.assertEqual(compile_string(script, key='+2'), t.to_html())
+        self.assertEqual(compile_string(script, key='0'), compile_string(script))
+
+
+if __name__ == '__main__':
+    unittest.main()